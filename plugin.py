@@ -1,11 +1,17 @@
 import logging
+import queue
 import threading
 import time
 import cv2
 import numpy as np
 import requests
+import collections
+import copy
+import itertools
 import json
 import os
+import shutil
+import sqlite3
 from flask import Flask, jsonify, request, Response, send_from_directory
 
 # ================================================================
@@ -22,43 +28,71 @@ logging.basicConfig(
 
 logging.info(">>> STARTING PLUGIN <<<")
 
-# Rolling log buffer
-LOG_BUFFER = []
-LOG_MAX_LINES = 300
+# Wakes the dashboard streams when something they show has changed
+_updates = threading.Condition()
+_update_seq = 0
 
-def add_log(msg: str):
-    """Store logs in a rolling buffer for the UI."""
-    global LOG_BUFFER
-    line = f"{time.strftime('%H:%M:%S')} - {msg}"
-    LOG_BUFFER.append(line)
-    if len(LOG_BUFFER) > LOG_MAX_LINES:
-        LOG_BUFFER = LOG_BUFFER[-LOG_MAX_LINES:]
-    print(line)  # Also print to console
+def notify_dashboard():
+    global _update_seq
+    with _updates:
+        _update_seq += 1
+        _updates.notify_all()
 
-def camera_name(cam_id):
-    """Convert camera ID to friendly name."""
-    return "Primary camera" if cam_id == 0 else "Secondary camera"
+def wait_dashboard(seen, timeout):
+    """Block until notify_dashboard() runs after marker `seen` (or timeout). Returns the new marker."""
+    with _updates:
+        _updates.wait_for(lambda: _update_seq != seen, timeout)
+        return _update_seq
+
+class LogRing(logging.Handler):
+    """
+    Keeps the last `capacity` log lines for the UI. Lines are numbered by
+    `seq` (lines ever stored), so readers can ask for just the new ones.
+    Other libraries' loggers only get in at WARNING and above.
+    """
 
-# Patch logging.info / error so all logs also go to UI buffer
-_old_info = logging.info
-_old_error = logging.error
-_old_warning = logging.warning
+    def __init__(self, capacity):
+        super().__init__(level=logging.INFO)
+        self.lines = collections.deque(maxlen=capacity)
+        self.seq = 0
 
-def patched_info(msg, *a, **k):
-    add_log(msg)
-    _old_info(msg, *a, **k)
+    def filter(self, record):
+        return record.name == "root" or record.levelno >= logging.WARNING
 
-def patched_error(msg, *a, **k):
-    add_log("ERROR: " + msg)
-    _old_error(msg, *a, **k)
+    def emit(self, record):
+        try:
+            prefix = f"{record.levelname}: " if record.levelno >= logging.WARNING else ""
+            stamp = time.strftime("%H:%M:%S", time.localtime(record.created))
+            self.lines.append(f"{stamp} - {prefix}{record.getMessage()}")
+            self.seq += 1
+        except Exception:
+            self.handleError(record)
+            return
+        notify_dashboard()
+
+    def since(self, seq):
+        """
+        Returns (seq, lines, reset): the lines stored after `seq`, or, with
+        reset=True, the whole ring when `seq` is None, already evicted or
+        from an earlier run.
+        """
+        with self.lock:
+            count = self.seq - seq if seq is not None else -1
+            if 0 <= count <= len(self.lines):
+                return self.seq, [self.lines[-i] for i in range(count, 0, -1)], False
+            return self.seq, list(self.lines), True
+
+LOG_MAX_LINES = 300
+log_ring = LogRing(LOG_MAX_LINES)
+logging.getLogger().addHandler(log_ring)
 
-def patched_warning(msg, *a, **k):
-    add_log("WARNING: " + msg)
-    _old_warning(msg, *a, **k)
+def add_log(msg: str):
+    """Log a line for the console and the UI."""
+    logging.info(msg)
 
-logging.info = patched_info
-logging.error = patched_error
-logging.warning = patched_warning
+def camera_name(cam_id):
+    """Convert camera ID to friendly name."""
+    return "Primary camera" if cam_id == 0 else "Secondary camera"
 
 # ================================================================
 #   APP + SETTINGS
@@ -99,8 +133,8 @@ def normalize_per_category(stats):
 
 default_config = {
     "cameras": [
-        {"id": 0, "name": "Primary", "url": "http://127.0.0.1/webcam/?action=snapshot", "enabled": True},
-        {"id": 1, "name": "Secondary", "url": "", "enabled": False},
+        {"id": 0, "name": "Primary", "url": "http://127.0.0.1/webcam/?action=snapshot", "enabled": True, "mode": "snapshot"},
+        {"id": 1, "name": "Secondary", "url": "", "enabled": False, "mode": "snapshot"},
     ],
     "camera_count": 1,
     "moonraker_url": "http://127.0.0.1:7125",
@@ -108,6 +142,75 @@ default_config = {
     "consecutive_failures": 3,
     "on_failure": "pause",
     "infer_every_n_loops": 1,
+    "reduced_decode": True,
+
+    # Inference backend: "auto" (tflite, else model.onnx via OpenCV DNN),
+    # "tflite" or "opencv". inference_threads = 0 autotunes at startup.
+    "inference_backend": "auto",
+    "inference_threads": 0,
+    "inference_xnnpack": True,
+    "inference_autotune": True,
+    "onnx_input_size": 640,
+    "batch_inference": True,
+    "max_batch": 4,
+
+    # Region of interest: "off" squashes the whole frame into the model,
+    # "auto" crops to the area left outside the mask zones, "bed" uses the
+    # per-camera roi_beds rectangle ({x, y, w, h} fractions, like mask zones).
+    # The crop is letterboxed, or split into overlapping tiles when fitting
+    # it whole would shrink it below roi_min_scale.
+    "roi_mode": "off",
+    "roi_beds": {"0": None, "1": None},
+    "roi_min_scale": 0.5,
+    "roi_tile_overlap": 0.2,
+    "roi_max_tiles": 4,
+
+    # Motion gate: skip the model when the (masked) scene has not changed
+    # since the last inference, but never for longer than motion_max_stale_ms.
+    "motion_gate": True,
+    "motion_threshold": 1.5,
+    "motion_max_stale_ms": 5000,
+
+    # Adaptive scheduling: tick faster (check_interval * fast factor) while
+    # anything is detected, slower after a clean streak, and never let the
+    # monitor work more than cpu_budget of the wall time.
+    "adaptive_schedule": True,
+    "schedule_fast_factor": 0.5,
+    "schedule_slow_factor": 3.0,
+    "cpu_budget": 0.5,
+
+    # Tracking: detections are matched across inference ticks by IoU (same
+    # class only) and keep an EMA of their confidence. A failure triggers
+    # once a single track has been matched on consecutive_failures ticks
+    # with its smoothed confidence at the trigger threshold.
+    "track_iou": 0.3,
+    "track_ema": 0.5,
+    "track_max_missed": 3,
+
+    # Dashboard preview: frames are downscaled to preview_max_width (0 =
+    # camera resolution) before annotation and encoding. Clients may ask
+    # for other values with ?w=, ?q= and ?fmt= ("jpeg" or "webp").
+    "preview_max_width": 960,
+    "preview_quality": 80,
+    "preview_format": "jpeg",
+
+    # Web server: "auto" uses waitress (bounded worker pool) when installed,
+    # else Flask's development server. web_threads serve ordinary requests;
+    # each live stream (MJPEG camera feed, SSE channel) holds one more
+    # worker, up to web_max_streams, beyond which streams get a 503.
+    "web_server": "auto",
+    "web_threads": 8,
+    "web_max_streams": 36,
+
+    # Failure archives: the last archive_frames camera JPEGs per camera
+    # are kept in memory while monitoring and archived, with an annotated
+    # frame, when a failure triggers (and for detections at or above
+    # archive_min_confidence %, 0 = off). Archives beyond archive_max_mb
+    # in total or older than archive_max_days are deleted, oldest first.
+    "archive_frames": 8,
+    "archive_min_confidence": 0,
+    "archive_max_mb": 500,
+    "archive_max_days": 30,
     "cam1_aspect_ratio": "4:3",
     "cam2_aspect_ratio": "4:3",
     "notify_mobileraker": False,
@@ -195,6 +298,10 @@ def save_config_to_file():
     except Exception:
         pass
 
+# Bumped by /api/settings whenever the matching config key changes, so
+# anything compiled from that key knows to rebuild.
+config_versions = {"masks": 0, "ai_categories": 0}
+
 # ================================================================
 #   RUNTIME STATE
 # ================================================================
@@ -209,8 +316,8 @@ state = {
     "manual_override": False,
     "show_mask_overlay": False,
     "cameras": {
-        0: {"frame": None, "score": 0.0},
-        1: {"frame": None, "score": 0.0},
+        0: {"view": (None, None), "frame_seq": 0, "score": 0.0},
+        1: {"view": (None, None), "frame_seq": 0, "score": 0.0},
     },
     "stats": {
         0: stats_block(),
@@ -218,6 +325,7 @@ state = {
     },
     "_last_print_state": None,
     "_print_summary_sent": False,
+    "session_id": None,  # event store session while monitoring
 }
 
 # Cache last inference results per camera
@@ -226,8 +334,10 @@ last_inference = {
     1: {"score": 0.0, "dets": []},
 }
 
-FAILURE_HISTORY = []
+# Recent events for the dashboard (this session); the full record is in
+# the event store
 MAX_FAILURE_HISTORY = 30
+FAILURE_HISTORY = collections.deque(maxlen=MAX_FAILURE_HISTORY)
 
 # Normalize stats categories (handles model upgrades)
 for cam_id in state["stats"]:
@@ -251,8 +361,10 @@ def wait_for_camera(cam_id, url, timeout_seconds=8):
 
     while time.time() - start < timeout_seconds:
         try:
-            r = CAM_SESSIONS.get(cam_id, requests).get(url, timeout=1.2)
-            if r.status_code == 200:
+            # stream=True so a stream URL only has its headers read
+            with CAM_SESSIONS.get(cam_id, requests).get(url, timeout=1.2, stream=True) as r:
+                status = r.status_code
+            if status == 200:
                 logging.info(f"{camera_name(cam_id)} is ready.")
                 camera_ready[cam_id] = True
                 return True
@@ -275,41 +387,289 @@ except ImportError:
     logging.warning("tflite-runtime not found.")
     tflite = None
 
-interpreter = None
-input_details = None
-output_details = None
+ONNX_MODEL_PATH = os.path.join(os.path.dirname(__file__), "model.onnx")
+
+class TFLiteBackend:
+    """tflite-runtime interpreter with a configurable thread count and XNNPACK toggle."""
+
+    name = "tflite"
+
+    def __init__(self, model_path, num_threads=2, xnnpack=True):
+        kwargs = {"model_path": model_path, "num_threads": num_threads}
+
+        # XNNPACK is tflite's default CPU delegate; opting out needs the
+        # resolver that skips default delegates (not in very old runtimes).
+        resolver = getattr(tflite, "OpResolverType", None)
+        if not xnnpack and resolver is not None:
+            kwargs["experimental_op_resolver_type"] = resolver.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+        self.xnnpack = xnnpack or resolver is None
+
+        self.num_threads = num_threads
+        self.batchable = True
+        self._kwargs = kwargs
+        self.interpreter = tflite.Interpreter(**kwargs)
+        self.interpreter.allocate_tensors()
+        # One interpreter per batch size, created on first use, so a batch
+        # never runs padding slots and switching sizes never reallocates
+        # (nor re-prepares a delegate). max_batch bounds how many there are.
+        self._interpreters = {1: self.interpreter}
+        self._load_details()
+
+    def _load_details(self):
+        self.input_details = self.interpreter.get_input_details()
+        self.output_details = self.interpreter.get_output_details()
+        self.input_shape = tuple(int(v) for v in self.input_details[0]["shape"])
+        self.input_dtype = self.input_details[0]["dtype"]
+        # (scale, zero_point); scale 0.0 means the tensor is not quantized
+        self.input_quant = tuple(self.input_details[0].get("quantization", (0.0, 0)))
+        self.output_quant = tuple(self.output_details[0].get("quantization", (0.0, 0)))
+
+    def input_tensor(self):
+        """
+        Writable NHWC view of the input tensor. Callers must drop every
+        reference to it before invoke().
+        """
+        return self.interpreter.tensor(self.input_details[0]["index"])()
+
+    def set_batch_size(self, n):
+        """
+        Switch to the interpreter sized for a batch of exactly n views. The
+        batch changes from tick to tick (motion gate, ROI tiles), so each
+        size is built once and kept. Returns False if the model can't batch.
+        """
+        if n > 1 and not self.batchable:
+            self._use(self._interpreters[1])
+            return False
+
+        interpreter = self._interpreters.get(n)
+        if interpreter is None:
+            try:
+                interpreter = tflite.Interpreter(**self._kwargs)
+                single = self._interpreters[1].get_input_details()[0]
+                shape = [int(v) for v in single["shape"]]
+                interpreter.resize_tensor_input(single["index"], [n, *shape[1:]], strict=False)
+                interpreter.allocate_tensors()
+                out_batch = int(interpreter.get_output_details()[0]["shape"][0])
+                if out_batch != n:
+                    raise ValueError(f"output batch stays {out_batch}")
+            except Exception as e:
+                logging.warning(f"Model does not support batch size {n}, running cameras one at a time: {e}")
+                self.batchable = False
+                self._use(self._interpreters[1])
+                return False
+            self._interpreters[n] = interpreter
+
+        self._use(interpreter)
+        return True
+
+    def _use(self, interpreter):
+        if interpreter is not self.interpreter:
+            self.interpreter = interpreter
+            self._load_details()
+
+    def invoke(self):
+        self.interpreter.invoke()
+
+    def output(self):
+        return self.interpreter.get_tensor(self.output_details[0]["index"])
+
+    def describe(self):
+        return f"tflite threads={self.num_threads} xnnpack={'on' if self.xnnpack else 'off'}"
+
+class OpenCVBackend:
+    """OpenCV DNN backend for ONNX exports of the same YOLO model."""
+
+    name = "opencv"
+
+    def __init__(self, model_path, num_threads=2, input_size=640):
+        cv2.setNumThreads(num_threads)  # process-wide in OpenCV
+        self.num_threads = num_threads
+        self.net = cv2.dnn.readNetFromONNX(model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+        # Stored NCHW as the network wants it; input_tensor() hands out an
+        # NHWC view so preprocessing writes into it without a transpose copy.
+        # One blob per batch size seen, so a batch never carries padding.
+        self._blob = np.zeros((1, 3, input_size, input_size), np.float32)
+        self._blobs = {1: self._blob}
+        self._output = None
+        self.input_shape = (1, input_size, input_size, 3)
+        self.input_dtype = np.float32
+        self.input_quant = (0.0, 0)
+        self.output_quant = (0.0, 0)
+        self.batchable = True
+
+    def input_tensor(self):
+        return self._blob.transpose(0, 2, 3, 1)
+
+    def set_batch_size(self, n):
+        """
+        Switch to the blob for a batch of exactly n views. ONNX exports with
+        a fixed batch fail at invoke, after which batchable is False and only
+        the batch-1 blob is used.
+        """
+        if n > 1 and not self.batchable:
+            n = 1
+        blob = self._blobs.get(n)
+        if blob is None:
+            _, c, h, w = self._blob.shape
+            blob = self._blobs[n] = np.zeros((n, c, h, w), np.float32)
+        self._blob = blob
+        self.input_shape = (n, *self.input_shape[1:])
+        return n == len(blob)
+
+    def invoke(self):
+        self.net.setInput(self._blob)
+        self._output = self.net.forward()
+
+    def output(self):
+        return self._output
+
+    def describe(self):
+        return f"opencv-dnn threads={self.num_threads}"
+
+backend = None
 input_height = 640
 input_width = 640
 input_dtype = np.float32
+input_lut = None
+
+def build_input_lut(dtype, quant):
+    """
+    Map every 0-255 pixel value straight to the model's input value, so
+    quantized inputs are filled with one table lookup. None for float models.
+    """
+    if dtype == np.float32:
+        return None
+
+    info = np.iinfo(dtype)
+    scale, zero_point = quant
+    pixels = np.arange(256, dtype=np.float64)
+
+    if scale > 0:
+        values = np.round(pixels / 255.0 / scale + zero_point)
+    elif dtype == np.int8:
+        values = pixels - 128  # int8 without parameters: centered pixels
+    else:
+        values = pixels
+
+    return np.clip(values, info.min, info.max).astype(dtype)
+
+def create_backend(kind, num_threads, xnnpack=True):
+    """Instantiate an inference backend by name ("tflite" or "opencv")."""
+    if kind == "tflite":
+        return TFLiteBackend(MODEL_PATH, num_threads=num_threads, xnnpack=xnnpack)
+    if kind == "opencv":
+        size = int(config.get("onnx_input_size", 640))
+        return OpenCVBackend(ONNX_MODEL_PATH, num_threads=num_threads, input_size=size)
+    raise ValueError(f"unknown inference backend '{kind}'")
+
+def pick_backend_kind():
+    """Resolve the inference_backend setting to an available backend, or None."""
+    wanted = config.get("inference_backend", "auto")
+    has_tflite = tflite is not None and os.path.exists(MODEL_PATH)
+    has_onnx = os.path.exists(ONNX_MODEL_PATH)
+
+    if wanted == "tflite" or (wanted == "auto" and has_tflite):
+        if not has_tflite:
+            logging.error(f"model.tflite not found at {MODEL_PATH} (or tflite-runtime missing)")
+            return None
+        return "tflite"
+
+    if wanted in ("opencv", "auto"):
+        if not has_onnx:
+            logging.error("No usable model: need model.tflite + tflite-runtime or model.onnx")
+            return None
+        return "opencv"
+
+    logging.error(f"Unknown inference_backend '{wanted}'")
+    return None
+
+def time_backend(candidate, runs=3):
+    """Median invoke time (seconds) on a synthetic frame, after one warm-up run."""
+    tensor = candidate.input_tensor()
+    tensor[...] = 114 if tensor.dtype == np.uint8 else 0.45
+    del tensor
+
+    candidate.invoke()
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        candidate.invoke()
+        times.append(time.perf_counter() - t0)
+    return sorted(times)[len(times) // 2]
+
+def autotune_backend(kind):
+    """
+    Time thread count / XNNPACK combinations and return the fastest
+    (num_threads, xnnpack). The result is remembered in the settings file
+    per model file so it only runs again when the model changes.
+    """
+    path = MODEL_PATH if kind == "tflite" else ONNX_MODEL_PATH
+    stat = os.stat(path)
+    signature = f"{kind}:{stat.st_size}:{int(stat.st_mtime)}"
+
+    tuned = config.get("inference_tuned") or {}
+    if tuned.get("model") == signature:
+        return int(tuned["threads"]), bool(tuned["xnnpack"])
+
+    cpus = os.cpu_count() or 2
+    thread_options = sorted({n for n in (1, 2, 4, cpus) if n <= cpus})
+    xnnpack_options = (True, False) if kind == "tflite" else (True,)
+
+    best = None
+    for threads in thread_options:
+        for xnnpack in xnnpack_options:
+            try:
+                candidate = create_backend(kind, threads, xnnpack)
+                elapsed = time_backend(candidate)
+            except Exception as e:
+                logging.warning(f"Autotune: {kind} threads={threads} xnnpack={xnnpack} failed: {e}")
+                continue
+
+            logging.info(f"Autotune: {candidate.describe()} → {elapsed*1000:.1f}ms")
+            if best is None or elapsed < best[0]:
+                best = (elapsed, threads, xnnpack)
+
+    if best is None:
+        return 2, True
+
+    config["inference_tuned"] = {"model": signature, "threads": best[1], "xnnpack": best[2]}
+    save_config_to_file()
+    return best[1], best[2]
 
 def load_model():
-    global interpreter, input_details, output_details
-    global input_height, input_width, input_dtype
+    global backend
+    global input_height, input_width, input_dtype, input_lut, _yolo_layout
 
-    if not os.path.exists(MODEL_PATH):
-        logging.error(f"model.tflite not found at {MODEL_PATH}")
+    kind = pick_backend_kind()
+    if kind is None:
         return False
 
     try:
-        interpreter = tflite.Interpreter(
-            model_path=MODEL_PATH,
-            num_threads=2
-        )
-            
-        interpreter.allocate_tensors()
+        threads = int(config.get("inference_threads", 0))
+        xnnpack = bool(config.get("inference_xnnpack", True))
 
-        input_details = interpreter.get_input_details()
-        output_details = interpreter.get_output_details()
+        if threads <= 0:
+            if config.get("inference_autotune", True):
+                threads, xnnpack = autotune_backend(kind)
+            else:
+                threads = 2
 
-        shape = input_details[0]["shape"]
+        backend = create_backend(kind, threads, xnnpack)
+
+        shape = backend.input_shape
         input_height, input_width = shape[1], shape[2]
-        input_dtype = input_details[0]["dtype"]
+        input_dtype = backend.input_dtype
+        input_lut = build_input_lut(input_dtype, backend.input_quant)
+        _yolo_layout = None
 
-        logging.info(f"Loaded TFLite model, input={shape}")
+        logging.info(f"Loaded model ({backend.describe()}), input={list(shape)}")
         return True
 
     except Exception as e:
-        logging.error(f"Failed to load TFLite: {e}")
+        logging.error(f"Failed to load model: {e}")
         return False
 
 ai_ready = load_model()
@@ -352,116 +712,647 @@ def get_mask_color_for_theme(theme_name, custom_theme):
     return hex_to_bgr(hexval)
 
 # ================================================================
-#   AI INFERENCE
+#   MASK COMPILATION
 # ================================================================
 
-def post_process_yolo(output_data, img_w, img_h, conf_threshold):
-    if output_data.shape[1] < output_data.shape[2]:
-        output = np.transpose(output_data[0])
-    else:
-        output = output_data[0]
+_mask_cache = {}
+
+def compile_mask(zones, h, w):
+    """
+    Rasterize mask zones (fractions of the frame) into a uint8 keep-mask of
+    shape (h, w, 1): 1 where the AI may look, 0 inside a zone.
+    Returns None when there is nothing to mask.
+    """
+    keep = None
+    for z in zones:
+        try:
+            zx = float(z["x"])
+            zy = float(z["y"])
+            zw = float(z["w"])
+            zh = float(z["h"])
+        except (KeyError, TypeError, ValueError):
+            continue
+
+        mx = int(zx * w)
+        my = int(zy * h)
+        mw = int(zw * w)
+        mh = int(zh * h)
+
+        mx = max(0, min(mx, w - 1))
+        my = max(0, min(my, h - 1))
+        mw = max(1, min(mw, w - mx))
+        mh = max(1, min(mh, h - my))
+
+        if keep is None:
+            keep = np.ones((h, w, 1), np.uint8)
+        # Inclusive end, matching a filled cv2.rectangle
+        keep[my:my+mh+1, mx:mx+mw+1] = 0
+
+    return keep
+
+def keep_bbox(keep):
+    """Bounding rectangle (x0, y0, x1, y1) of the unmasked area; the full frame if all is masked."""
+    h, w = keep.shape[:2]
+    rows = np.flatnonzero(keep[:, :, 0].any(axis=1))
+    cols = np.flatnonzero(keep[:, :, 0].any(axis=0))
+    if len(rows) == 0 or len(cols) == 0:
+        return (0, 0, w, h)
+    return (int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1)
+
+def get_mask(cam_id, shape):
+    """
+    Cached compiled mask for (camera, frame size, mask config version).
+    Returns None when the camera has no mask zones.
+    """
+    h, w = shape[:2]
+    version = config_versions["masks"]
+    key = (cam_id, h, w, version)
+
+    if key not in _mask_cache:
+        # Drop entries compiled from an older mask config
+        for old in [k for k in _mask_cache if k[3] != version]:
+            _mask_cache.pop(old, None)
+
+        zones = config.get("masks", {}).get(str(cam_id), [])
+        keep = compile_mask(zones, h, w)
+        _mask_cache[key] = None if keep is None else {
+            "keep": keep,
+            "zone": keep[:, :, 0] == 0,
+            "bbox": keep_bbox(keep),
+        }
+
+    return _mask_cache[key]
+
+def apply_mask(img, cam_id):
+    """Return a copy of `img` with masked zones blacked out (or `img` itself if unmasked)."""
+    mask = get_mask(cam_id, img.shape)
+    if mask is None:
+        return img
+    return img * mask["keep"]
+
+# ================================================================
+#   CLASS THRESHOLDS
+# ================================================================
+
+_threshold_cache = {}
+
+def get_class_thresholds(cam_id):
+    """
+    Per-camera detect/trigger threshold vectors indexed by model class id,
+    rebuilt only when ai_categories changes. Disabled (or unknown) classes
+    get +inf so they never pass; non-triggering classes get +inf trigger.
+    """
+    version = config_versions["ai_categories"]
+    key = (cam_id, version)
+
+    thresholds = _threshold_cache.get(key)
+    if thresholds is None:
+        categories = config.get("ai_categories", {})
+        detect = np.full(len(CLASS_NAMES), np.inf, np.float32)
+        trigger = np.full(len(CLASS_NAMES), np.inf, np.float32)
+
+        for cid, name in enumerate(CLASS_NAMES):
+            cat_cfg = categories.get(name.lower())
+            if not cat_cfg or not cat_cfg.get("enabled", True):
+                continue
+
+            # Use camera-specific thresholds; fall back to deprecated global values for compatibility
+            detect[cid] = float(cat_cfg.get(f"cam{cam_id}_detect_threshold", cat_cfg.get("detect_threshold", 0.30)))
+            if cat_cfg.get("trigger", False):
+                trigger[cid] = float(cat_cfg.get(f"cam{cam_id}_trigger_threshold", cat_cfg.get("trigger_threshold", 0.70)))
+
+        for old in [k for k in _threshold_cache if k[1] != version]:
+            _threshold_cache.pop(old, None)
 
-    boxes = []
-    confidences = []
-    class_ids = []
+        thresholds = {"detect": detect, "trigger": trigger}
+        _threshold_cache[key] = thresholds
 
-    sample_coords = output[:, :4].flatten()
-    is_norm = np.max(sample_coords) <= 1.5
+    return thresholds
 
-    if is_norm:
-        x_factor, y_factor = img_w, img_h
+# ================================================================
+#   REGION OF INTEREST
+# ================================================================
+
+# Last ROI size per camera as (width, height) fractions of the frame,
+# so the capture workers can pick a JPEG decode scale for the crop
+roi_fractions = {}
+
+def get_roi(cam_id, shape):
+    """
+    Pixel rectangle (x0, y0, x1, y1) the model should look at for roi_mode.
+    "bed" without a bed drawn for the camera falls back to "auto".
+    """
+    h, w = shape[:2]
+    mode = config.get("roi_mode", "off")
+    roi = (0, 0, w, h)
+
+    if mode == "bed":
+        bed = (config.get("roi_beds") or {}).get(str(cam_id))
+        try:
+            x0 = max(0, min(int(float(bed["x"]) * w), w - 1))
+            y0 = max(0, min(int(float(bed["y"]) * h), h - 1))
+            x1 = max(x0 + 1, min(int((float(bed["x"]) + float(bed["w"])) * w), w))
+            y1 = max(y0 + 1, min(int((float(bed["y"]) + float(bed["h"])) * h), h))
+            roi = (x0, y0, x1, y1)
+            mode = None
+        except (KeyError, TypeError, ValueError):
+            mode = "auto"
+
+    if mode == "auto":
+        mask = get_mask(cam_id, shape)
+        if mask is not None:
+            roi = mask["bbox"]
+
+    roi_fractions[cam_id] = ((roi[2] - roi[0]) / w, (roi[3] - roi[1]) / h)
+    return roi
+
+def tiles_along(length, tile, overlap):
+    """Number of tiles of size `tile` needed to cover `length` with at least `overlap` (fraction)."""
+    if tile >= length:
+        return 1
+    step = tile * (1.0 - overlap)
+    return int(np.ceil((length - tile) / step)) + 1
+
+def tile_rects(x0, y0, x1, y1):
+    """
+    Split an ROI into overlapping tiles so that each is letterboxed at no
+    less than roi_min_scale. Tiles grow when more than roi_max_tiles would
+    be needed. Returns a list of (x0, y0, x1, y1).
+    """
+    roi_w, roi_h = x1 - x0, y1 - y0
+    min_scale = min(max(float(config.get("roi_min_scale", 0.5)), 0.05), 4.0)
+    if min(input_width / roi_w, input_height / roi_h) >= min_scale:
+        return [(x0, y0, x1, y1)]
+
+    overlap = min(max(float(config.get("roi_tile_overlap", 0.2)), 0.0), 0.5)
+    max_tiles = max(1, int(config.get("roi_max_tiles", 4)))
+
+    tile_w = input_width / min_scale
+    tile_h = input_height / min_scale
+    while True:
+        nx = tiles_along(roi_w, tile_w, overlap)
+        ny = tiles_along(roi_h, tile_h, overlap)
+        if nx * ny <= max_tiles:
+            break
+        tile_w *= 1.25
+        tile_h *= 1.25
+
+    tile_w = int(min(tile_w, roi_w))
+    tile_h = int(min(tile_h, roi_h))
+
+    # Spread tiles evenly so the first and last touch the ROI edges
+    xs = [x0 + (i * (roi_w - tile_w)) // max(nx - 1, 1) for i in range(nx)]
+    ys = [y0 + (j * (roi_h - tile_h)) // max(ny - 1, 1) for j in range(ny)]
+    return [(tx, ty, tx + tile_w, ty + tile_h) for ty in ys for tx in xs]
+
+def build_views(cam_id, image):
+    """
+    Model views for one (masked) frame as a list of (crop, origin).
+    origin is None for the legacy whole-frame squash, else the (x, y) of
+    the crop in the frame; such crops are letterboxed.
+    """
+    if config.get("roi_mode", "off") == "off":
+        roi_fractions.pop(cam_id, None)
+        return [(image, None)]
+
+    x0, y0, x1, y1 = get_roi(cam_id, image.shape)
+    return [
+        (image[ty0:ty1, tx0:tx1], (tx0, ty0))
+        for tx0, ty0, tx1, ty1 in tile_rects(x0, y0, x1, y1)
+    ]
+
+# ================================================================
+#   AI INFERENCE
+# ================================================================
+
+# One row per detection; boxes are (left, top, width, height) in image pixels
+DETECTION_DTYPE = np.dtype([
+    ("box", np.int32, (4,)),
+    ("conf", np.float32),
+    ("class", np.int32),
+])
+
+# Output layout of the loaded model, probed once on the first frame
+# (the export format never changes at runtime). Reset by load_model().
+_yolo_layout = None
+
+def dequantize(values, quant):
+    """Convert quantized integers to floats using (scale, zero_point); floats pass through."""
+    scale, zero_point = quant
+    if scale > 0 and values.dtype != np.float32:
+        return (values.astype(np.float32) - zero_point) * scale
+    return values.astype(np.float32, copy=False)
+
+def probe_yolo_layout(output, quant):
+    """Detect whether the output is (4+C, N) or (N, 4+C) and whether boxes are normalized."""
+    channels_first = output.shape[0] < output.shape[1]
+    coords = dequantize(output[:4] if channels_first else output[:, :4], quant)
+    return {
+        "channels_first": channels_first,
+        "normalized": bool(np.max(coords) <= 1.5),
+    }
+
+def post_process_yolo(output_data, img_w, img_h, class_thresholds, quant=(0.0, 0), transform=None):
+    """
+    Decode a YOLOv8-style output tensor into a DETECTION_DTYPE array.
+    `class_thresholds` holds the detect threshold per class id (+inf for
+    disabled classes); boxes below their class threshold never reach NMS.
+    For quantized outputs `quant` is the tensor's (scale, zero_point):
+    thresholds are compared in the quantized domain and only rows that
+    pass are dequantized.
+    `transform` = (sx, sy, ox, oy) maps model-input pixels to image pixels
+    (x * sx + ox); by default the whole image was squashed into the input.
+    Thresholding, box conversion and clamping are done on arrays; only
+    NMS survivors are returned.
+    """
+    global _yolo_layout
+
+    output = output_data[0]
+    if _yolo_layout is None:
+        _yolo_layout = probe_yolo_layout(output, quant)
+
+    # Work on (4+C, N) without copying when possible
+    rows = output if _yolo_layout["channels_first"] else output.T
+
+    if transform is None:
+        transform = (img_w / input_width, img_h / input_height, 0.0, 0.0)
+    x_factor, y_factor, x_offset, y_offset = transform
+    if _yolo_layout["normalized"]:
+        x_factor *= input_width
+        y_factor *= input_height
+
+    scores = rows[4:]
+    num_classes = scores.shape[0]
+    if len(class_thresholds) != num_classes:
+        # Classes the UI does not know about are never reported
+        padded = np.full(num_classes, np.inf, np.float32)
+        n = min(num_classes, len(class_thresholds))
+        padded[:n] = class_thresholds[:n]
+        class_thresholds = padded
+
+    min_threshold = float(class_thresholds.min())
+    if not np.isfinite(min_threshold):
+        return np.empty(0, DETECTION_DTYPE)
+
+    # Scores are monotonic in their quantized value, so threshold there
+    scale, zero_point = quant
+    if scale > 0 and scores.dtype != np.float32:
+        raw_thresholds = class_thresholds / scale + zero_point
     else:
-        x_factor = img_w / input_width
-        y_factor = img_h / input_height
+        raw_thresholds = class_thresholds
+
+    # Cheap pre-filter at the lowest threshold, then the exact per-class one
+    max_scores = scores.max(axis=0)
+    valid = np.flatnonzero(max_scores >= raw_thresholds.min())
+    class_ids = scores[:, valid].argmax(axis=0).astype(np.int32)
+    passed = max_scores[valid] >= raw_thresholds[class_ids]
+    valid = valid[passed]
+    class_ids = class_ids[passed]
+
+    if len(valid) == 0:
+        return np.empty(0, DETECTION_DTYPE)
+
+    confidences = dequantize(max_scores[valid], quant)
+    cx, cy, w, h = dequantize(rows[:4, valid], quant)
+
+    boxes = np.empty((len(valid), 4), np.int32)
+    boxes[:, 0] = np.maximum((cx - w / 2) * x_factor + x_offset, 0)   # left
+    boxes[:, 1] = np.maximum((cy - h / 2) * y_factor + y_offset, 0)   # top
+    boxes[:, 2] = np.minimum(w * x_factor, img_w - boxes[:, 0])   # width
+    boxes[:, 3] = np.minimum(h * y_factor, img_h - boxes[:, 1])   # height
+
+    indices = cv2.dnn.NMSBoxes(boxes, confidences, min_threshold, 0.45)
+    keep = np.asarray(indices, np.int64).reshape(-1)
+
+    results = np.empty(len(keep), DETECTION_DTYPE)
+    results["box"] = boxes[keep]
+    results["conf"] = confidences[keep]
+    results["class"] = class_ids[keep]
+    return results
 
-    scores = output[:, 4:]
-    max_scores = np.max(scores, axis=1)
-    max_indices = np.argmax(scores, axis=1)
-    valid = np.where(max_scores >= conf_threshold)[0]
+# Preprocessing buffers per (camera, view), reused across frames
+_input_buffers = {}
+
+def get_input_buffers(key):
+    """Return the model-shaped resize/RGB scratch buffers for a camera view."""
+    bufs = _input_buffers.get(key)
+    if bufs is None or bufs["resized"].shape != (input_height, input_width, 3):
+        bufs = {
+            "resized": np.empty((input_height, input_width, 3), np.uint8),
+            "rgb": np.empty((input_height, input_width, 3), np.uint8),
+            "letterbox": None,
+            "scaled": None,
+        }
+        _input_buffers[key] = bufs
+    return bufs
+
+def letterbox_into(image, bufs):
+    """
+    Fit `image` into bufs["resized"] keeping its aspect ratio, padded with
+    YOLO grey. Returns (scale, pad_x, pad_y).
+    """
+    h, w = image.shape[:2]
+    scale = min(input_width / w, input_height / h)
+    new_w = max(1, min(input_width, int(round(w * scale))))
+    new_h = max(1, min(input_height, int(round(h * scale))))
+    pad_x = (input_width - new_w) // 2
+    pad_y = (input_height - new_h) // 2
+
+    layout = (new_w, new_h, pad_x, pad_y)
+    if bufs["letterbox"] != layout:
+        # Padding only needs repainting when the layout changes
+        bufs["resized"].fill(114)
+        bufs["scaled"] = np.empty((new_h, new_w, 3), np.uint8)
+        bufs["letterbox"] = layout
+
+    cv2.resize(image, (new_w, new_h), dst=bufs["scaled"])
+    bufs["resized"][pad_y:pad_y + new_h, pad_x:pad_x + new_w] = bufs["scaled"]
+    return scale, pad_x, pad_y
+
+def write_input_tensor(image, key, index=0, origin=None):
+    """
+    Resize + BGR→RGB (+ 1/255 scaling for float models) straight into slot
+    `index` of the backend's input tensor, without allocating per-frame arrays.
+    With an `origin` (ROI crop) the image is letterboxed instead of squashed.
+    Returns the (sx, sy, ox, oy) transform from model-input to frame pixels.
+    """
+    bufs = get_input_buffers(key)
+    if origin is None:
+        h, w = image.shape[:2]
+        cv2.resize(image, (input_width, input_height), dst=bufs["resized"])
+        transform = (w / input_width, h / input_height, 0.0, 0.0)
+    else:
+        scale, pad_x, pad_y = letterbox_into(image, bufs)
+        transform = (1.0 / scale, 1.0 / scale,
+                     origin[0] - pad_x / scale, origin[1] - pad_y / scale)
+
+    # View into the backend's input memory; must be released before invoke()
+    tensor = backend.input_tensor()
+    dst = tensor[index]
+
+    if input_lut is None:
+        cv2.cvtColor(bufs["resized"], cv2.COLOR_BGR2RGB, dst=bufs["rgb"])
+        np.multiply(bufs["rgb"], np.float32(1.0 / 255.0), out=dst)
+    elif dst.flags["C_CONTIGUOUS"] and dst.dtype == np.uint8 and input_lut[255] == 255 and input_lut[0] == 0:
+        # Identity quantization (scale 1/255, zero point 0): plain pixels
+        cv2.cvtColor(bufs["resized"], cv2.COLOR_BGR2RGB, dst=dst)
+    else:
+        # Quantize through the lookup table
+        cv2.cvtColor(bufs["resized"], cv2.COLOR_BGR2RGB, dst=bufs["rgb"])
+        np.take(input_lut, bufs["rgb"], out=dst, mode="clip")
 
-    for i in valid:
-        sc = float(max_scores[i])
-        cid = int(max_indices[i])
-        cx, cy, w, h = output[i][:4]
+    del tensor, dst
+    return transform
 
-        left = int((cx - w / 2) * x_factor)
-        top = int((cy - h / 2) * y_factor)
-        width = int(w * x_factor)
-        height = int(h * y_factor)
+def decode_output(out, cam_id, frame_shape, transform):
+    """Post-process one view's slice of the output into frame coordinates."""
+    frame_h, frame_w = frame_shape[:2]
+    thresholds = get_class_thresholds(cam_id)
+    return post_process_yolo(out, frame_w, frame_h, thresholds["detect"],
+                             backend.output_quant, transform)
 
-        left = max(0, left)
-        top = max(0, top)
-        width = min(width, img_w - left)
-        height = min(height, img_h - top)
+def merge_detections(parts):
+    """
+    Combine the detections of one camera's views. Tiles overlap, so more
+    than one view gets a class-agnostic NMS pass in frame coordinates.
+    Returns (best_score, detections).
+    """
+    detections = parts[0] if len(parts) == 1 else np.concatenate(parts)
 
-        boxes.append([left, top, width, height])
-        confidences.append(sc)
-        class_ids.append(cid)
+    if len(parts) > 1 and len(detections) > 1:
+        indices = cv2.dnn.NMSBoxes(detections["box"], detections["conf"], 0.0, 0.45)
+        detections = detections[np.asarray(indices, np.int64).reshape(-1)]
 
-    indices = cv2.dnn.NMSBoxes(boxes, confidences, conf_threshold, 0.45)
+    if len(detections) == 0:
+        return 0.0, detections
+    return float(detections["conf"].max()), detections
 
+def infer_views(views):
+    """
+    Run the model over (cam_id, key, crop, origin, frame_shape) views.
+    Views go through one invoke per batch_inference chunk when the backend
+    can resize its batch, else one at a time. Returns detections per view.
+    """
+    chunk = len(views) if config.get("batch_inference", True) and backend.batchable else 1
+    chunk = max(1, min(chunk, int(config.get("max_batch", 4))))
     results = []
-    if len(indices) > 0:
-        for i in indices.flatten():
-            results.append({
-                "box": boxes[i],
-                "conf": confidences[i],
-                "class": class_ids[i]
-            })
+
+    start = 0
+    while start < len(views):
+        part = views[start:start + chunk]
+        if not backend.set_batch_size(len(part)):
+            part, chunk = part[:1], 1
+            backend.set_batch_size(1)
+
+        transforms = [
+            write_input_tensor(crop, key, index, origin)
+            for index, (cam_id, key, crop, origin, shape) in enumerate(part)
+        ]
+        backend.invoke()
+
+        out = backend.output()
+        for index, (cam_id, key, crop, origin, shape) in enumerate(part):
+            results.append(decode_output(out[index:index + 1], cam_id, shape, transforms[index]))
+        start += len(part)
 
     return results
 
+def run_inference_batch(items):
+    """
+    Run inference for several (cam_id, image) pairs. Each image becomes one
+    or more model views (whole frame, ROI crop or ROI tiles); when the
+    backend supports it, views share invokes at batch size N. Returns
+    {cam_id: (score, dets)} with boxes in frame coordinates.
+    """
+    if not ai_ready or backend is None or not items:
+        return {cam_id: (0.0, []) for cam_id, _ in items}
 
-def run_inference(image, cam_id: int):
-    if not ai_ready or interpreter is None:
-        return 0.0, []
+    views = []
+    for cam_id, image in items:
+        for index, (crop, origin) in enumerate(build_views(cam_id, image)):
+            views.append((cam_id, (cam_id, index), crop, origin, image.shape))
 
     try:
-        orig_h, orig_w = image.shape[:2]
-        resized = cv2.resize(image, (input_width, input_height))
-        rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
-        inp = np.expand_dims(rgb, 0)
+        detections = infer_views(views)
+    except Exception as e:
+        if len(views) == 1 or not backend.batchable:
+            logging.error(f"Inference failed: {e}")
+            return {cam_id: (0.0, []) for cam_id, _ in items}
+        logging.warning(f"Batched inference failed, running views one at a time: {e}")
+        backend.batchable = False
+        return run_inference_batch(items)
+
+    per_camera = {}
+    for view, dets in zip(views, detections):
+        per_camera.setdefault(view[0], []).append(dets)
+    return {cam_id: merge_detections(parts) for cam_id, parts in per_camera.items()}
 
-        if input_dtype == np.float32:
-            inp = inp.astype(np.float32) / 255.0
-        elif input_dtype == np.uint8:
-            inp = inp.astype(np.uint8)
+def run_inference(image, cam_id: int):
+    return run_inference_batch([(cam_id, image)])[cam_id]
 
-        interpreter.set_tensor(input_details[0]["index"], inp)
-        interpreter.invoke()
+# ================================================================
+#   MOTION GATE
+# ================================================================
 
-        out = interpreter.get_tensor(output_details[0]["index"])
+MOTION_THUMB_SIZE = (64, 48)
 
-        cats = config.get("ai_categories", {})
-        detect_thresholds = []
-        for c in cats.values():
-            if not c.get("enabled", True):
-                continue
+# Thumbnail and time of the last frame actually inferred, per camera
+motion_refs = {}
 
-            cam_key = f"cam{cam_id}_detect_threshold"
-            # Prefer camera-specific threshold; fall back to deprecated global detect_threshold
-            detect_thresholds.append(c.get(cam_key, c.get("detect_threshold", 0.3)))
+def motion_thumbnail(img, cam_id):
+    """Small grayscale copy of a frame with mask zones zeroed."""
+    small = cv2.resize(img, MOTION_THUMB_SIZE, interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
 
-        conf_thresh = min(detect_thresholds) if detect_thresholds else 0.3
-        detections = post_process_yolo(out, orig_w, orig_h, conf_thresh)
+    mask = get_mask(cam_id, gray.shape)
+    if mask is not None:
+        gray = gray * mask["keep"][:, :, 0]
+    return gray
 
-        if not detections:
-            return 0.0, []
+def scene_changed(cam_id, img, now):
+    """
+    Decide whether a frame is worth running the model on. Returns
+    (changed, thumbnail); pass the thumbnail to mark_inferred() if the
+    frame is inferred. The gate is open while a failure may be building
+    (failure_count > 0 or the camera has a visible track), since a
+    confirmation needs consecutive_failures inferences, not scene changes.
+    """
+    if not config.get("motion_gate", True):
+        return True, None
 
-        best = max(d["conf"] for d in detections)
-        return best, detections
+    thumb = motion_thumbnail(img, cam_id)
+    ref = motion_refs.get(cam_id)
+    max_stale_s = float(config.get("motion_max_stale_ms", 5000)) / 1000.0
 
-    except Exception as e:
-        logging.error(f"Inference failed: {e}")
-        return 0.0, []
+    if ref is None or ref["thumb"].shape != thumb.shape or now - ref["time"] >= max_stale_s:
+        return True, thumb
+
+    tracker = trackers.get(cam_id)
+    if state["failure_count"] > 0 or (tracker is not None and (tracker["tracks"]["missed"] == 0).any()):
+        return True, thumb
+
+    mask = get_mask(cam_id, thumb.shape)
+    visible = thumb.size if mask is None else max(1, int(mask["keep"].sum()))
+    diff = cv2.absdiff(thumb, ref["thumb"])
+
+    # Mean change per unmasked pixel, in gray levels
+    change = float(diff.sum()) / visible
+    return change >= float(config.get("motion_threshold", 1.5)), thumb
+
+def mark_inferred(cam_id, thumb, now):
+    """Remember the frame the model last saw, for the motion gate."""
+    if thumb is not None:
+        motion_refs[cam_id] = {"thumb": thumb, "time": now}
+
+# ================================================================
+#   DETECTION TRACKING
+# ================================================================
+
+# One row per live track; boxes are in frame pixels like DETECTION_DTYPE
+TRACK_DTYPE = np.dtype([
+    ("id", np.int32),
+    ("box", np.int32, (4,)),
+    ("class", np.int32),
+    ("conf", np.float32),    # EMA-smoothed confidence
+    ("hits", np.int32),      # inference ticks the track was matched on
+    ("trigger_hits", np.int32),  # matched ticks at trigger confidence, less misses
+    ("age", np.int32),       # inference ticks since it appeared
+    ("missed", np.int32),    # inference ticks since it was last matched
+    ("reported", np.int8),   # 0 = not in history yet, 1 = detect, 2 = trigger
+])
+
+def new_tracker():
+    return {"tracks": np.empty(0, TRACK_DTYPE), "next_id": 1}
+
+trackers = {0: new_tracker(), 1: new_tracker()}
+
+def reset_trackers():
+    for cam_id in trackers:
+        trackers[cam_id] = new_tracker()
+
+def iou_matrix(a, b):
+    """Pairwise IoU of (N, 4) and (M, 4) (left, top, width, height) boxes as an (N, M) array."""
+    a = a.astype(np.float32)
+    b = b.astype(np.float32)
+    iw = (np.minimum((a[:, 0] + a[:, 2])[:, None], (b[:, 0] + b[:, 2])[None, :])
+          - np.maximum(a[:, 0][:, None], b[:, 0][None, :]))
+    ih = (np.minimum((a[:, 1] + a[:, 3])[:, None], (b[:, 1] + b[:, 3])[None, :])
+          - np.maximum(a[:, 1][:, None], b[:, 1][None, :]))
+    inter = np.clip(iw, 0, None) * np.clip(ih, 0, None)
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None, :] - inter
+    return inter / np.maximum(union, 1e-6)
+
+def update_tracks(cam_id, dets, trigger_thresholds):
+    """
+    Associate one inference tick's detections with the camera's tracks,
+    greedily by highest IoU. Matched tracks take the new box and an EMA of
+    the confidence, unmatched detections start new tracks, and tracks
+    missed for more than track_max_missed ticks are dropped. trigger_hits
+    counts the matched ticks a track's smoothed confidence was at its
+    class's trigger threshold: a missed tick takes one off (the track may
+    still come back), a matched tick below the threshold resets it.
+    Returns the live tracks.
+    """
+    tracker = trackers[cam_id]
+    tracks = tracker["tracks"]
+    min_iou = float(config.get("track_iou", 0.3))
+    alpha = min(max(float(config.get("track_ema", 0.5)), 0.0), 1.0)
+    max_missed = max(0, int(config.get("track_max_missed", 3)))
+
+    tracks["age"] += 1
+    tracks["missed"] += 1
+    matched_dets = np.zeros(len(dets), bool)
+
+    if len(tracks) and len(dets):
+        iou = iou_matrix(tracks["box"], dets["box"])
+        iou[tracks["class"][:, None] != dets["class"][None, :]] = 0.0
+
+        pairs_t, pairs_d = np.nonzero(iou >= min_iou)
+        order = np.argsort(-iou[pairs_t, pairs_d], kind="stable")
+        matched_tracks = np.zeros(len(tracks), bool)
+
+        for t, d in zip(pairs_t[order], pairs_d[order]):
+            if matched_tracks[t] or matched_dets[d]:
+                continue
+            matched_tracks[t] = matched_dets[d] = True
+            tracks["box"][t] = dets["box"][d]
+            tracks["conf"][t] = alpha * dets["conf"][d] + (1.0 - alpha) * tracks["conf"][t]
+            tracks["hits"][t] += 1
+            tracks["missed"][t] = 0
+
+    matched = tracks["missed"] == 0
+    at_trigger = tracks["conf"] >= trigger_thresholds[tracks["class"]]
+    tracks["trigger_hits"] = np.where(
+        matched,
+        np.where(at_trigger, tracks["trigger_hits"] + 1, 0),
+        np.maximum(tracks["trigger_hits"] - 1, 0),
+    )
+
+    fresh = dets[~matched_dets]
+    born = np.zeros(len(fresh), TRACK_DTYPE)
+    born["id"] = np.arange(tracker["next_id"], tracker["next_id"] + len(fresh))
+    born["box"] = fresh["box"]
+    born["class"] = fresh["class"]
+    born["conf"] = fresh["conf"]
+    born["hits"] = 1
+    born["trigger_hits"] = born["conf"] >= trigger_thresholds[born["class"]]
+    born["age"] = 1
+    tracker["next_id"] += len(fresh)
+
+    tracker["tracks"] = np.concatenate([tracks[tracks["missed"] <= max_missed], born])
+    return tracker["tracks"]
 
 # ================================================================
 #   HTTP ROUTES - CONTROL
 # ================================================================
 
-@app.route("/api/action/start", methods=["POST", "GET"])
-def action_start():
+# Commands below run on the monitor thread via run_in_monitor()
+
+def start_monitoring(manual):
     FAILURE_HISTORY.clear()
+    recent_frames.clear()
+    end_session()
+    begin_session("manual" if manual else "macro")
     state["stats"][0] = stats_block()
     state["stats"][1] = stats_block()
     normalize_per_category(state["stats"][0])
@@ -471,62 +1362,198 @@ def action_start():
     state["action_triggered"] = False
     state["failure_cam"] = None
     state["failure_reason"] = None
-    state["manual_override"] = True
-    state["_print_summary_sent"] = False
-    logging.info("Monitoring STARTED (manual)")
-    return jsonify({"success": True})
+    reset_trackers()
+    state["manual_override"] = manual
+    if manual:
+        state["_print_summary_sent"] = False
+        logging.info("Monitoring STARTED (manual)")
+    else:
+        logging.info("Monitoring STARTED (print start macro)")
 
-@app.route("/api/action/stop", methods=["POST", "GET"])
-def action_stop():
+def stop_monitoring():
     state["monitoring_active"] = False
+    end_session()
     state["failure_cam"] = None
     state["failure_reason"] = None
     logging.info("Monitoring STOPPED")
     send_print_summary()
-    
+
+def set_mask_overlay(show):
+    state["show_mask_overlay"] = show
+
+def reset_stats(cam_id):
+    state["stats"][cam_id] = stats_block()
+    logging.info(f"Stats reset for {camera_name(cam_id)}")
+
+def command_response(done):
+    """Reply for a command route: 202 if the monitor has not run the command yet (it still will)."""
+    if not done:
+        return jsonify({"success": True, "status": "queued"}), 202
     return jsonify({"success": True})
 
+@app.route("/api/action/start", methods=["POST", "GET"])
+def action_start():
+    done, _ = run_in_monitor(start_monitoring, True)
+    return command_response(done)
+
+@app.route("/api/action/stop", methods=["POST", "GET"])
+def action_stop():
+    done, _ = run_in_monitor(stop_monitoring)
+    return command_response(done)
+
 @app.route("/api/action/start_from_macro", methods=["POST"])
 def action_start_from_macro():
-    FAILURE_HISTORY.clear()
-    state["stats"][0] = stats_block()
-    state["stats"][1] = stats_block()
-    normalize_per_category(state["stats"][0])
-    normalize_per_category(state["stats"][1])
-    state["monitoring_active"] = True
-    state["failure_count"] = 0
-    state["action_triggered"] = False
-    state["failure_cam"] = None
-    state["failure_reason"] = None
-    state["manual_override"] = False
-    logging.info("Monitoring STARTED (print start macro)")
-    return jsonify({"success": True})
+    done, _ = run_in_monitor(start_monitoring, False)
+    return command_response(done)
 
 @app.route("/api/action/toggle_mask", methods=["POST"])
 def toggle_mask():
-    state["show_mask_overlay"] = request.json.get("show", False)
-    return jsonify({"success": True})
+    done, _ = run_in_monitor(set_mask_overlay, bool(request.json.get("show", False)))
+    return command_response(done)
 
 @app.route("/api/stats/reset/<int:cam_id>", methods=["POST"])
 def reset_camera_stats(cam_id):
     if cam_id not in state["stats"]:
         return jsonify({"success": False, "error": "Invalid camera"}), 400
 
-    state["stats"][cam_id] = stats_block()
-
-    logging.info(f"Stats reset for {camera_name(cam_id)}")
-    return jsonify({"success": True})
+    done, _ = run_in_monitor(reset_stats, cam_id)
+    return command_response(done)
 
 # ================================================================
 #   PRINT STATE (Moonraker)
 # ================================================================
 
+try:
+    import websocket
+except ImportError:
+    logging.warning("websocket-client not found, polling Moonraker over HTTP.")
+    websocket = None
+
+# Printer state cache, kept current by Moonraker push notifications.
+# While the websocket is down, get_printer_state() falls back to HTTP.
+printer = {
+    "state": "standby",
+    "filename": "",
+    "progress": 0.0,
+    "connected": False,
+    "updated": 0.0,
+}
+printer_lock = threading.Lock()
+
+MOONRAKER_OBJECTS = {
+    "print_stats": ["state", "filename"],
+    "virtual_sdcard": ["progress"],
+}
+
+def moonraker_ws_url():
+    url = config.get("moonraker_url", "").rstrip("/")
+    if url.startswith("https://"):
+        url = "wss://" + url[len("https://"):]
+    elif url.startswith("http://"):
+        url = "ws://" + url[len("http://"):]
+    return f"{url}/websocket"
+
+def apply_printer_status(status):
+    """Merge a (partial) Moonraker status dict into the printer cache."""
+    print_stats = status.get("print_stats") or {}
+    sdcard = status.get("virtual_sdcard") or {}
+
+    with printer_lock:
+        if "state" in print_stats:
+            printer["state"] = print_stats["state"]
+        if "filename" in print_stats:
+            printer["filename"] = print_stats["filename"]
+        if "progress" in sdcard:
+            printer["progress"] = float(sdcard["progress"])
+        printer["updated"] = time.time()
+
+def moonraker_subscribe(ws):
+    ws.send(json.dumps({
+        "jsonrpc": "2.0",
+        "method": "printer.objects.subscribe",
+        "params": {"objects": MOONRAKER_OBJECTS},
+        "id": 1,
+    }))
+
+def moonraker_client():
+    """
+    Hold a JSON-RPC websocket to Moonraker subscribed to print_stats and
+    virtual_sdcard, applying push notifications to the printer cache.
+    Re-subscribes when Klippy restarts, reconnects with backoff, and
+    follows moonraker_url changes.
+    """
+    backoff = 1.0
+
+    while True:
+        url = moonraker_ws_url()
+        ws = None
+        try:
+            ws = websocket.create_connection(url, timeout=5)
+            ws.settimeout(15)
+            moonraker_subscribe(ws)
+
+            while True:
+                try:
+                    raw = ws.recv()
+                except websocket.WebSocketTimeoutException:
+                    if moonraker_ws_url() != url:
+                        break
+                    ws.ping()
+                    continue
+
+                if not raw:
+                    break
+
+                msg = json.loads(raw)
+                method = msg.get("method")
+
+                if msg.get("id") == 1:
+                    if "result" in msg:
+                        apply_printer_status(msg["result"].get("status", {}))
+                        if not printer["connected"]:
+                            logging.info("Moonraker websocket connected.")
+                        printer["connected"] = True
+                        backoff = 1.0
+                    else:
+                        # Klippy not ready yet; notify_klippy_ready follows
+                        printer["connected"] = False
+
+                elif method == "notify_status_update":
+                    apply_printer_status(msg["params"][0])
+
+                elif method == "notify_klippy_ready":
+                    moonraker_subscribe(ws)
+
+                elif method in ("notify_klippy_shutdown", "notify_klippy_disconnected"):
+                    apply_printer_status({"print_stats": {"state": "standby"}})
+                    printer["connected"] = False
+
+        except Exception as e:
+            if printer["connected"]:
+                logging.warning(f"Moonraker websocket lost: {e}")
+
+        finally:
+            printer["connected"] = False
+            if ws is not None:
+                try:
+                    ws.close()
+                except Exception:
+                    pass
+
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 30.0)
+
 def get_printer_state():
+    """Cached printer state; polls Moonraker over HTTP only while the websocket is down."""
+    if printer["connected"]:
+        return printer["state"]
+
     url = config.get("moonraker_url", "").rstrip("/")
     try:
-        r = MOONRAKER_SESSION.get(f"{url}/printer/objects/query?print_stats", timeout=0.4)
+        r = MOONRAKER_SESSION.get(f"{url}/printer/objects/query?print_stats&virtual_sdcard", timeout=0.4)
         if r.status_code == 200:
-            return r.json()["result"]["status"]["print_stats"]["state"]
+            apply_printer_status(r.json()["result"]["status"])
+            return printer["state"]
     except:
         pass
     return "standby"
@@ -535,19 +1562,82 @@ def get_printer_state():
 #   ACTIONS ON FAILURE
 # ================================================================
 
+# Moonraker POSTs run on background lanes so a hung Moonraker never stalls
+# the monitor: "control" (pause/cancel) and "notify" (console messages)
+# each have their own worker, so a pause never queues behind a message.
+# Moonraker only answers pause/cancel once the PAUSE/CANCEL macro is done
+# (parking moves included), so the control lane waits much longer for a
+# reply; timeouts are (connect, read) seconds.
+ACTION_TIMEOUTS_S = {"control": (2.0, 60.0), "notify": (2.0, 2.0)}
+ACTION_RETRIES = 2
+
+action_queues = {"control": queue.Queue(), "notify": queue.Queue()}
+
+def dispatch(lane, path, payload=None, then=()):
+    """
+    Queue a Moonraker POST on `lane`. `then` holds (path, payload) jobs put
+    on the notify lane once this one is done or has given up, for
+    notifications that must follow it.
+    """
+    action_queues[lane].put((path, payload, tuple(then), time.perf_counter()))
+
+def moonraker_post(path, payload, lane):
+    """
+    POST with the lane's timeouts, retrying connection errors and 5xx.
+    Returns True on success. On the control lane a read timeout counts as
+    sent: Moonraker has the request and is still running the macro.
+    """
+    url = config.get("moonraker_url", "").rstrip("/")
+    timeout = ACTION_TIMEOUTS_S[lane]
+    error = None
+
+    for attempt in range(ACTION_RETRIES + 1):
+        if attempt:
+            time.sleep(0.25 * attempt)
+        try:
+            r = MOONRAKER_SESSION.post(f"{url}{path}", json=payload, timeout=timeout)
+        except requests.ConnectionError as e:
+            error = e
+            continue
+        except requests.ReadTimeout as e:
+            if lane == "control":
+                logging.warning(f"Moonraker {path} sent, no reply within {timeout[1]:.0f}s")
+                return True
+            error = e
+            break
+        except requests.RequestException as e:
+            # A read timeout may still have run the script; do not repeat it
+            error = e
+            break
+
+        if r.status_code < 400:
+            return True
+        error = f"HTTP {r.status_code}"
+        if r.status_code < 500:
+            break  # rejected (e.g. already paused), retrying will not help
+
+    logging.warning(f"Moonraker {path} failed: {error}")
+    return False
+
+def action_worker(lane):
+    jobs = action_queues[lane]
+    while True:
+        path, payload, then, queued_at = jobs.get()
+        ok = moonraker_post(path, payload, lane)
+
+        if lane == "control" and ok:
+            logging.info(f"Moonraker {path} sent in {(time.perf_counter() - queued_at) * 1000:.0f}ms")
+
+        for follow_path, follow_payload in then:
+            dispatch("notify", follow_path, follow_payload)
+
 def send_to_console(message: str):
     """Send a message to the printer console via M118 GCode command."""
     url = config.get("moonraker_url", "").rstrip("/")
     if not url:
         return
-    
-    try:
-        requests.post(
-            f"{url}/printer/gcode/script",
-            json={"script": f"M118 {message}"}
-        )
-    except Exception:
-        pass
+
+    dispatch("notify", "/printer/gcode/script", {"script": f"M118 {message}"})
 
 
 def format_print_summary(camera_count: int) -> list:
@@ -654,73 +1744,881 @@ def trigger_printer_action(reason="Failure"):
         return
 
     action = config.get("on_failure", "nothing")
-    url = config.get("moonraker_url", "").rstrip("/")
 
     logging.info(f"Failure confirmed: {reason} | Action = {action}")
 
-    try:
-        requests.post(
-            f"{url}/printer/gcode/script",
-            json={"script": f"M118 >>> {reason.upper()}! Action: {action.upper()} <<<"}
+    notifications = [
+        ("/printer/gcode/script", {"script": f"M118 >>> {reason.upper()}! Action: {action.upper()} <<<"}),
+    ]
+
+    # --- Mobileraker notification (optional) ---
+    if config.get("notify_mobileraker", False):
+        action_name = {
+            "nothing": "Warning",
+            "pause": "Pause Print",
+            "cancel": "Cancel Print"
+        }.get(action, action)
+
+        notify_msg = f"⚠️ AI Failure Detected – Action: {action_name}"
+        notifications.append(
+            ("/printer/gcode/script", {"script": f'MR_NOTIFY MESSAGE="{notify_msg}"'})
         )
-        
-        # --- Mobileraker notification (optional) ---
-        if config.get("notify_mobileraker", False):
-            action_name = {
-                "nothing": "Warning",
-                "pause": "Pause Print",
-                "cancel": "Cancel Print"
-            }.get(action, action)
-
-            notify_msg = f"⚠️ AI Failure Detected – Action: {action_name}"
-
-            requests.post(
-                f"{url}/printer/gcode/script",
-                json={"script": f'MR_NOTIFY MESSAGE="{notify_msg}"'}
+
+    # The pause/cancel goes out first on its own lane; messages follow it
+    if action in ("pause", "cancel"):
+        dispatch("control", f"/printer/print/{action}", then=notifications)
+    else:
+        for path, payload in notifications:
+            dispatch("notify", path, payload)
+
+    state["action_triggered"] = True
+
+
+# ================================================================
+#   SCHEDULER
+# ================================================================
+
+MIN_INTERVAL_S = 0.1
+CLEAN_TICKS_BEFORE_SLOW = 10
+
+scheduler = {
+    "mode": "normal",          # idle | clean | normal | alert
+    "interval_s": 0.5,
+    "duty_cycle": 0.0,         # share of wall time the monitor spends working
+    "rate_hz": 0.0,            # effective tick rate
+    "infer_ms": {cam_id: 0.0 for cam_id in state["cameras"]},
+    "clean_ticks": 0,
+    "last_tick": None,
+}
+
+def base_interval_s():
+    return max(MIN_INTERVAL_S, float(config.get("check_interval", 500)) / 1000.0)
+
+def current_interval_s():
+    """Interval the monitor and capture workers currently run at."""
+    if not config.get("adaptive_schedule", True):
+        return base_interval_s()
+    return scheduler["interval_s"]
+
+def update_schedule(risky, inferred):
+    """
+    Choose the next tick interval: fast while a failure is building or
+    anything is detected, slow after CLEAN_TICKS_BEFORE_SLOW clean
+    inferences, check_interval otherwise.
+    """
+    base = base_interval_s()
+
+    if risky:
+        scheduler["clean_ticks"] = 0
+        scheduler["mode"] = "alert"
+        factor = float(config.get("schedule_fast_factor", 0.5))
+    else:
+        if inferred:
+            scheduler["clean_ticks"] += 1
+        if scheduler["clean_ticks"] >= CLEAN_TICKS_BEFORE_SLOW:
+            scheduler["mode"] = "clean"
+            factor = float(config.get("schedule_slow_factor", 3.0))
+        else:
+            scheduler["mode"] = "normal"
+            factor = 1.0
+
+    scheduler["interval_s"] = max(MIN_INTERVAL_S, base * factor)
+
+def record_inference_time(cam_ids, elapsed_s):
+    """Smoothed per-camera inference latency (a batch is split evenly)."""
+    if not cam_ids:
+        return
+    per_cam_ms = elapsed_s * 1000.0 / len(cam_ids)
+    for cam_id in cam_ids:
+        prev = scheduler["infer_ms"].get(cam_id, 0.0)
+        scheduler["infer_ms"][cam_id] = per_cam_ms if prev == 0.0 else prev * 0.8 + per_cam_ms * 0.2
+
+def schedule_sleep(loop_start, busy_s):
+    """
+    Sleep until the next tick: the current interval, stretched so the
+    monitor's busy time stays within cpu_budget of the wall time.
+    """
+    elapsed = time.perf_counter() - loop_start
+    budget = min(1.0, max(0.05, float(config.get("cpu_budget", 0.5))))
+
+    sleep_s = current_interval_s() - elapsed
+    if config.get("adaptive_schedule", True):
+        sleep_s = max(sleep_s, busy_s / budget - elapsed)
+
+    monitor_sleep(max(sleep_s, 0.001))
+
+    # Effective rate and duty cycle, measured tick start to tick start
+    now = time.perf_counter()
+    last = scheduler["last_tick"]
+    scheduler["last_tick"] = now
+    if last is not None:
+        period = max(1e-6, now - last)
+        scheduler["rate_hz"] = scheduler["rate_hz"] * 0.8 + (1.0 / period) * 0.2
+        scheduler["duty_cycle"] = scheduler["duty_cycle"] * 0.8 + min(1.0, busy_s / period) * 0.2
+
+def scheduler_status():
+    """Scheduler numbers for /api/status."""
+    return {
+        "mode": scheduler["mode"],
+        "interval_ms": round(current_interval_s() * 1000.0),
+        "rate_hz": round(scheduler["rate_hz"], 2),
+        "duty_cycle": round(scheduler["duty_cycle"], 3),
+        "cpu_budget": float(config.get("cpu_budget", 0.5)),
+        "infer_ms": {str(k): round(v, 1) for k, v in scheduler["infer_ms"].items()},
+    }
+
+# ================================================================
+#   CAMERA CAPTURE WORKERS
+# ================================================================
+
+def new_capture_slot():
+    """Latest-frame slot shared between a capture worker and the monitor."""
+    return {
+        "cond": threading.Condition(),
+        "seq": 0,          # bumped on every publish
+        "consumed": 0,     # last seq taken by the monitor
+        "image": None,
+        "jpeg": None,      # the camera's own bytes for `image`, if JPEG
+        "error": None,
+    }
+
+capture_slots = {cam_id: new_capture_slot() for cam_id in state["cameras"]}
+
+def get_camera_config(cam_id):
+    """Return the config entry for a camera id, or None."""
+    for cam in config.get("cameras", []):
+        if cam.get("id") == cam_id:
+            return cam
+    return None
+
+def is_camera_active(cam):
+    """True if the camera is enabled, configured and within camera_count."""
+    if not cam:
+        return False
+    if cam["id"] >= int(config.get("camera_count", 2)):
+        return False
+    return bool(cam.get("enabled")) and bool(cam.get("url"))
+
+def publish_frame(cam_id, image=None, error=None, data=None):
+    """Hand a decoded frame (with the bytes it came from) or a capture error to the monitor."""
+    slot = capture_slots[cam_id]
+    with slot["cond"]:
+        slot["seq"] += 1
+        slot["image"] = image
+        slot["jpeg"] = data if data is not None and data[:2] == b"\xff\xd8" else None
+        slot["error"] = error
+        slot["cond"].notify_all()
+
+def take_frame(cam_id, deadline):
+    """
+    Wait until the capture worker publishes a frame newer than the last one
+    taken, or until `deadline` (perf_counter time) passes.
+    Returns (image, jpeg, error, fresh).
+    """
+    slot = capture_slots[cam_id]
+    with slot["cond"]:
+        slot["cond"].wait_for(
+            lambda: slot["seq"] > slot["consumed"],
+            timeout=max(0.0, deadline - time.perf_counter())
+        )
+        if slot["seq"] <= slot["consumed"]:
+            return None, None, None, False
+
+        slot["consumed"] = slot["seq"]
+        slot["cond"].notify_all()  # let the worker start the next fetch
+        return slot["image"], slot["jpeg"], slot["error"], True
+
+# JPEG start-of-frame markers (SOF0..SOF15 minus DHT/JPG/DAC)
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+def jpeg_size(data):
+    """Read (width, height) from the JPEG SOF header without decoding. None if not found."""
+    i = 2
+    n = len(data)
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in SOF_MARKERS:
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return width, height
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # markers without a length
+            i += 2
+            continue
+        i += 2 + ((data[i + 2] << 8) | data[i + 3])
+    return None
+
+def tile_scale(width, height):
+    """Letterbox scale of the tiles tile_rects() cuts from a width x height ROI, capped at 1."""
+    x0, y0, x1, y1 = tile_rects(0, 0, max(1, int(width)), max(1, int(height)))[0]
+    return min(input_width / (x1 - x0), input_height / (y1 - y0), 1.0)
+
+def pick_decode_scale(width, height, tiled=False):
+    """
+    Largest libjpeg scale-down factor (1/2/4/8) whose output still fills the
+    model input. Without an ROI the frame is squashed into the input one
+    axis at a time, so both axes must keep at least the input's rows and
+    columns. With an ROI (tiled=True) the crop is letterboxed and the tiles
+    cut from the reduced image must keep the detail per camera pixel the
+    full-resolution tiles would have, so the factor never decodes away the
+    resolution tiling exists to keep.
+    """
+    if tiled:
+        full = tile_scale(width, height)
+        for factor in (8, 4, 2):
+            if tile_scale(width / factor, height / factor) / factor >= full * 0.999:
+                return factor
+        return 1
+
+    limit = min(width / input_width, height / input_height)
+    for factor in (8, 4, 2):
+        if factor <= limit:
+            return factor
+    return 1
+
+def decode_frame(data, cam_id=None):
+    """
+    Decode JPEG bytes into a BGR image. Returns None on invalid data.
+    The image is decoded straight at reduced size (DCT scaling) when the
+    camera resolution is well above the model input, so a full-resolution
+    image is never built. With an ROI the crop, not the frame, has to
+    fill the model input.
+    """
+    arr = np.frombuffer(data, np.uint8)
+    flag = cv2.IMREAD_COLOR
+
+    if config.get("reduced_decode", True):
+        size = jpeg_size(data)
+        if size:
+            frac_w, frac_h = roi_fractions.get(cam_id, (1.0, 1.0))
+            tiled = config.get("roi_mode", "off") != "off"
+            flag = REDUCED_DECODE_FLAGS[pick_decode_scale(size[0] * frac_w, size[1] * frac_h, tiled)]
+
+    return cv2.imdecode(arr, flag)
+
+def fetch_snapshot(cam_id, cam):
+    """Fetch and decode one snapshot. Returns (image, bytes); image is None if the data is not one."""
+    sess = CAM_SESSIONS.get(cam_id, requests)
+    r = sess.get(cam["url"], timeout=1.5)
+
+    if r.status_code != 200:
+        raise ValueError(f"HTTP {r.status_code}")
+
+    return decode_frame(r.content, cam_id), r.content
+
+def get_stream_url(cam):
+    """MJPEG stream URL for a camera (crowsnest: ?action=snapshot → ?action=stream)."""
+    return cam.get("stream_url") or cam["url"].replace("action=snapshot", "action=stream")
+
+def split_jpegs(buf):
+    """
+    Pop every complete JPEG (SOI ... EOI) out of `buf` (a bytearray) and
+    return the newest one, or None. Multipart headers between frames are
+    discarded along with incomplete leading data.
+    """
+    latest = None
+    while True:
+        start = buf.find(b"\xff\xd8")
+        if start < 0:
+            # Keep a trailing 0xFF in case the SOI marker is split across chunks
+            del buf[:-1]
+            return latest
+
+        end = buf.find(b"\xff\xd9", start + 2)
+        if end < 0:
+            del buf[:start]
+            return latest
+
+        latest = bytes(buf[start:end + 2])
+        del buf[:end + 2]
+
+def read_mjpeg_stream(cam_id, cam):
+    """
+    Keep the camera's MJPEG stream open and publish the newest frame once the
+    monitor has taken the previous one and the tick interval has passed. Frames
+    in between are skipped without decoding. Returns when the camera config
+    changes; raises on stream errors so the caller can reconnect.
+    """
+    slot = capture_slots[cam_id]
+    sess = CAM_SESSIONS.get(cam_id, requests)
+    url = get_stream_url(cam)
+
+    with sess.get(url, timeout=(1.5, 5.0), stream=True) as r:
+        if r.status_code != 200:
+            raise ValueError(f"HTTP {r.status_code}")
+
+        logging.info(f"{camera_name(cam_id)} stream opened.")
+        buf = bytearray()
+        latest = None
+        last_publish = 0.0
+
+        for chunk in r.iter_content(chunk_size=32768):
+            current = get_camera_config(cam_id)
+            if (not is_camera_active(current)
+                    or current.get("mode", "snapshot") != "stream"
+                    or get_stream_url(current) != url):
+                return
+
+            buf += chunk
+            if len(buf) > 8 * 1024 * 1024:
+                raise ValueError("stream frame too large")
+
+            newest = split_jpegs(buf)
+            if newest is not None:
+                latest = newest
+            if latest is None:
+                continue
+
+            interval_s = current_interval_s()
+            since = time.perf_counter() - last_publish
+            if since < interval_s:
+                continue
+            # Same pacing as the snapshot path: wait for the monitor, but not forever
+            if slot["consumed"] < slot["seq"] and since < max(interval_s, 1.0):
+                continue
+
+            data, latest = latest, None
+            img = decode_frame(data, cam_id)
+            last_publish = time.perf_counter()
+
+            if img is None:
+                logging.warning(f"{camera_name(cam_id)} provided invalid image data.")
+                publish_frame(cam_id, error="invalid image")
+            else:
+                publish_frame(cam_id, image=img, data=data)
+
+    raise ValueError("stream closed")
+
+def capture_worker(cam_id):
+    """
+    Capture/decode stage for one camera. Runs on its own thread so a slow or
+    stalled camera never holds up the other one or the inference stage.
+    """
+    slot = capture_slots[cam_id]
+
+    while True:
+        fetch_start = time.perf_counter()
+        interval_s = current_interval_s()
+        cam = get_camera_config(cam_id)
+
+        if not is_camera_active(cam):
+            time.sleep(0.5)
+            continue
+
+        try:
+            # 1. CAMERA READINESS CHECK
+            if not camera_ready.get(cam_id, False):
+                if not wait_for_camera(cam_id, cam["url"], timeout_seconds=8):
+                    # Camera never came ready → no error yet, but report no frame
+                    publish_frame(cam_id, error="not ready")
+                    continue
+            # If ready once, NEVER skip the block again
+
+            # 2a. STREAM MODE: runs until the stream drops or config changes
+            if cam.get("mode", "snapshot") == "stream":
+                read_mjpeg_stream(cam_id, cam)
+                continue
+
+            # 2b. NORMAL FRAME FETCH
+            img, data = fetch_snapshot(cam_id, cam)
+
+            if img is None:
+                logging.warning(f"{camera_name(cam_id)} provided invalid image data.")
+                publish_frame(cam_id, error="invalid image")
+            else:
+                publish_frame(cam_id, image=img, data=data)
+
+        except Exception as e:
+            # Only log errors AFTER the camera succeeded at least once
+            if camera_ready.get(cam_id, False):
+                logging.error(f"{camera_name(cam_id)} error: {e}")
+            publish_frame(cam_id, error=str(e))
+
+            # A dropped stream goes back through the readiness check to reconnect
+            if cam.get("mode", "snapshot") == "stream":
+                camera_ready[cam_id] = False
+                time.sleep(1.0)
+                continue
+
+        # Wait for the monitor to pick the frame up, then pace to the tick interval
+        with slot["cond"]:
+            slot["cond"].wait_for(
+                lambda: slot["consumed"] >= slot["seq"],
+                timeout=max(interval_s, 1.0)
             )
 
-        if action == "pause":
-            requests.post(f"{url}/printer/print/pause")
-        elif action == "cancel":
-            requests.post(f"{url}/printer/print/cancel")
+        sleep_s = interval_s - (time.perf_counter() - fetch_start)
+        if sleep_s > 0:
+            time.sleep(sleep_s)
 
-    except Exception:
-        pass
+# ================================================================
+#   FAILURE EVENT STORE
+# ================================================================
 
-    state["action_triggered"] = True
+# Every history event is also appended to an SQLite file, tagged with the
+# monitoring session (one per start) it happened in. The monitor only
+# queues rows; event_writer inserts them in batches, so the hot loop
+# never waits on the disk.
+EVENTS_DB = os.path.join(os.path.dirname(__file__), "failure_events.db")
+EVENT_BATCH_S = 0.5
+
+EVENT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    ended REAL,
+    source TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    session INTEGER,
+    time REAL NOT NULL,
+    camera INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    confidence INTEGER NOT NULL,
+    severity TEXT NOT NULL,
+    track INTEGER,
+    x REAL, y REAL, w REAL, h REAL,              -- box as fractions of the frame
+    archive TEXT                                 -- failure archive name
+);
+CREATE INDEX IF NOT EXISTS events_time ON events (time);
+CREATE INDEX IF NOT EXISTS events_category_time ON events (category, time);
+CREATE INDEX IF NOT EXISTS events_session ON events (session, id);
+"""
+
+EVENT_WRITES = {
+    "session": "INSERT OR REPLACE INTO sessions (id, started, source) VALUES (?, ?, ?)",
+    "end": "UPDATE sessions SET ended = ? WHERE id = ?",
+    "event": ("INSERT INTO events (session, time, camera, category, confidence, severity, track,"
+              " x, y, w, h, archive) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"),
+}
+
+_event_rows = queue.Queue(maxsize=10000)
+
+def open_event_db():
+    db = sqlite3.connect(EVENTS_DB, timeout=5.0)
+    db.row_factory = sqlite3.Row
+    # WAL lets API reads run while the writer commits
+    db.execute("PRAGMA journal_mode=WAL")
+    return db
+
+def init_event_store():
+    """Create the schema if needed. Returns the first free session id."""
+    try:
+        db = open_event_db()
+        try:
+            db.executescript(EVENT_SCHEMA)
+            columns = {row["name"] for row in db.execute("PRAGMA table_info(events)")}
+            if "snapshot" in columns:
+                db.execute("ALTER TABLE events RENAME COLUMN snapshot TO archive")
+            elif "archive" not in columns:
+                db.execute("ALTER TABLE events ADD COLUMN archive TEXT")
+            # Version 1: boxes are fractions of the frame. Earlier rows held
+            # pixels of a decode-dependent frame size, so they are dropped.
+            if db.execute("PRAGMA user_version").fetchone()[0] < 1:
+                with db:
+                    db.execute("UPDATE events SET x = NULL, y = NULL, w = NULL, h = NULL")
+                    db.execute("PRAGMA user_version = 1")
+            return (db.execute("SELECT MAX(id) FROM sessions").fetchone()[0] or 0) + 1
+        finally:
+            db.close()
+    except sqlite3.Error as e:
+        logging.error(f"Event store unavailable: {e}")
+        return 1
+
+_session_ids = itertools.count(init_event_store())
+
+def queue_event_write(kind, row):
+    try:
+        _event_rows.put_nowait((kind, row))
+    except queue.Full:
+        logging.warning(f"Event store is not keeping up, dropped a {kind} row")
+
+def begin_session(source):
+    state["session_id"] = next(_session_ids)
+    queue_event_write("session", (state["session_id"], time.time(), source))
+
+def end_session():
+    if state.get("session_id") is not None:
+        queue_event_write("end", (time.time(), state["session_id"]))
+        state["session_id"] = None
+
+def box_fractions(box, shape):
+    """(left, top, width, height) pixel box as fractions of a frame of `shape`."""
+    h, w = shape[:2]
+    x, y, bw, bh = (int(v) for v in box)
+    return [round(x / w, 4), round(y / h, 4), round(bw / w, 4), round(bh / h, 4)]
+
+def record_event(camera, category, confidence, severity, track, box):
+    """
+    Add an event to the dashboard history and queue it for the store
+    (monitor thread). `box` is in fractions of the frame (box_fractions()),
+    since the decoded frame size depends on reduced_decode and roi_mode.
+    Failures, and detections at or above archive_min_confidence, get a
+    failure archive.
+    """
+    now = time.time()
+    min_conf = int(config.get("archive_min_confidence", 0))
+    archive = None
+    if severity == "failure" or (min_conf > 0 and confidence >= min_conf):
+        archive = request_archive(camera, severity, track, now)
+
+    FAILURE_HISTORY.append({
+        "time": time.strftime("%H:%M:%S", time.localtime(now)),
+        "ts": now,
+        "session": state.get("session_id"),
+        "camera": camera,
+        "category": category,
+        "confidence": confidence,
+        "severity": severity,
+        "track": track,
+        "box": box,
+        "archive": archive,
+    })
+    queue_event_write("event", (state.get("session_id"), now, camera, category,
+                                confidence, severity, track, *box, archive))
+
+def event_writer():
+    """Insert queued rows, one transaction per batch of whatever arrived within EVENT_BATCH_S."""
+    db = open_event_db()
+    try:
+        while True:
+            batch = [_event_rows.get()]
+            time.sleep(EVENT_BATCH_S)
+            while True:
+                try:
+                    batch.append(_event_rows.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                with db:
+                    for kind, row in batch:
+                        db.execute(EVENT_WRITES[kind], row)
+            except sqlite3.Error as e:
+                logging.error(f"Event store write failed, {len(batch)} rows lost: {e}")
+    finally:
+        db.close()
+
+# ================================================================
+#   FAILURE ARCHIVES
+# ================================================================
 
+# While monitoring, the monitor keeps each camera's last few frames as the
+# camera sent them (JPEG bytes, no re-encoding). An event that wants an
+# archive is queued at the end of the tick with those frames and the
+# frame it was detected on; archive_writer annotates and writes them to
+# ARCHIVE_DIR/<name>/ and applies retention, off the monitor thread.
+ARCHIVE_DIR = os.path.join(os.path.dirname(__file__), "failure_archives")
+
+recent_frames = {}
+_pending_archives = []
+_archive_jobs = queue.Queue(maxsize=16)
+
+def keep_recent_frame(cam_id, jpeg):
+    count = max(1, int(config.get("archive_frames", 8)))
+    frames = recent_frames.get(cam_id)
+    if frames is None or frames.maxlen != count:
+        frames = recent_frames[cam_id] = collections.deque(frames or (), maxlen=count)
+    frames.append(jpeg)
+
+def request_archive(cam_id, severity, track, now):
+    """Reserve an archive name for an event; it is queued by queue_archives() at the end of the tick."""
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+    name = f"{stamp}-{int(now * 1000) % 1000:03d}-cam{cam_id}-{severity}-{track}"
+    _pending_archives.append((name, cam_id))
+    return name
+
+def queue_archives():
+    """Hand this tick's archive requests to the writer (monitor thread, never blocks)."""
+    while _pending_archives:
+        name, cam_id = _pending_archives.pop(0)
+        image, overlay = state["cameras"][cam_id]["view"]
+        try:
+            _archive_jobs.put_nowait((name, tuple(recent_frames.get(cam_id, ())), image, overlay))
+        except queue.Full:
+            logging.warning(f"Archive writer is not keeping up, dropped {name}")
+
+def write_archive(name, frames, image, overlay):
+    """Write the frames (oldest first) and the annotated frame, then move the folder into place."""
+    tmp = os.path.join(ARCHIVE_DIR, f".{name}")
+    os.makedirs(tmp, exist_ok=True)
+
+    for i, data in enumerate(frames):
+        with open(os.path.join(tmp, f"frame-{i:02d}.jpg"), "wb") as f:
+            f.write(data)
+
+    if image is not None:
+        shown = annotate(image, overlay) if overlay is not None else image
+        ok, buf = cv2.imencode(".jpg", shown, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        if ok:
+            with open(os.path.join(tmp, "annotated.jpg"), "wb") as f:
+                f.write(buf.tobytes())
+
+    os.replace(tmp, os.path.join(ARCHIVE_DIR, name))
+
+def prune_archives():
+    """Delete archives, oldest first, while any is past archive_max_days or the total is over archive_max_mb."""
+    max_bytes = float(config.get("archive_max_mb", 500)) * 1024 * 1024
+    cutoff = time.time() - float(config.get("archive_max_days", 30)) * 86400
+
+    archives = []
+    for entry in os.scandir(ARCHIVE_DIR):
+        if entry.name.startswith("."):
+            # Left over from a write that failed part-way
+            shutil.rmtree(entry.path, ignore_errors=True)
+        elif entry.is_dir():
+            size = sum(f.stat().st_size for f in os.scandir(entry.path))
+            archives.append((entry.stat().st_mtime, entry.path, size))
+    archives.sort()
+
+    total = sum(size for _, _, size in archives)
+    for mtime, path, size in archives:
+        if mtime >= cutoff and total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+def archive_writer():
+    # Archives from before the folder was renamed
+    old_dir = os.path.join(os.path.dirname(__file__), "failure_snapshots")
+    if os.path.isdir(old_dir) and not os.path.exists(ARCHIVE_DIR):
+        os.replace(old_dir, ARCHIVE_DIR)
+
+    while True:
+        name, frames, image, overlay = _archive_jobs.get()
+        try:
+            write_archive(name, frames, image, overlay)
+            prune_archives()
+        except OSError as e:
+            logging.error(f"Could not write archive {name}: {e}")
+
+# ================================================================
+#   MONITOR SNAPSHOT & COMMANDS
+# ================================================================
+
+# `state`, the stats and FAILURE_HISTORY belong to the monitor thread.
+# HTTP handlers read the snapshot it republishes after every tick (one
+# reference swap, never mutated afterwards) and send their writes as
+# commands the monitor runs between ticks.
+snapshot = None
+
+_commands = queue.Queue()
+_monitor_wake = threading.Event()
+
+def publish_snapshot():
+    global snapshot
+    snapshot = {
+        "status": {
+            "status": state["status"],
+            "score": max(cam["score"] for cam in state["cameras"].values()),
+            "failures": state["failure_count"],
+            "max_retries": config["consecutive_failures"],
+            "cam_stats": copy.deepcopy(state["stats"]),
+            "failure_cam": state.get("failure_cam"),
+            "failure_reason": copy.deepcopy(state.get("failure_reason")),
+            "scheduler": scheduler_status(),
+            "printer": {
+                "state": printer["state"],
+                "progress": printer["progress"],
+                "connected": printer["connected"],
+            },
+        },
+        # History events are never modified once appended
+        "history": tuple(FAILURE_HISTORY),
+        "views": {
+            cam_id: (cam["frame_seq"], *cam["view"])
+            for cam_id, cam in state["cameras"].items()
+        },
+        "show_mask_overlay": state.get("show_mask_overlay", False),
+        "session": state.get("session_id"),
+    }
+    notify_dashboard()
+
+def run_in_monitor(fn, *args, timeout=2.0):
+    """
+    Queue fn(*args) for the monitor thread and wait up to `timeout` for it.
+    Returns (done, result); the command still runs later if it timed out.
+    """
+    done = threading.Event()
+    box = {}
+
+    def command():
+        try:
+            box["result"] = fn(*args)
+        finally:
+            done.set()
+
+    _commands.put(command)
+    _monitor_wake.set()
+    finished = done.wait(timeout)
+    return finished, box.get("result")
+
+def drain_commands():
+    """Run queued API commands on the monitor thread. Returns True if any ran."""
+    ran = False
+    while True:
+        try:
+            command = _commands.get_nowait()
+        except queue.Empty:
+            return ran
+        try:
+            command()
+        except Exception as e:
+            logging.error(f"Command failed: {e}")
+        ran = True
+
+def monitor_sleep(seconds):
+    """Sleep between ticks, applying (and publishing) API commands as they arrive."""
+    deadline = time.perf_counter() + seconds
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0 or not _monitor_wake.wait(remaining):
+            return
+        _monitor_wake.clear()
+        if drain_commands():
+            publish_snapshot()
 
 # ================================================================
 #   BACKGROUND MONITOR LOOP
 # ================================================================
 
+_frame_seq = itertools.count(1)
+
+def publish_view(cam_id, image, overlay=None):
+    """
+    Publish the raw frame the dashboard shows for a camera (None = no
+    signal) together with its overlay (tracks to draw). Nothing is drawn
+    here: encoded_frame() annotates lazily, once per sequence number, and
+    only if a client asks. Published images are made read-only.
+    """
+    cam = state["cameras"][cam_id]
+    if image is None and cam["view"][0] is None:
+        return
+    if image is not None:
+        image.flags.writeable = False
+    cam["view"] = (image, overlay)
+    cam["frame_seq"] = next(_frame_seq)
+
+def evaluate_detections(cam_id, img, dets, do_infer):
+    """
+    Feed one camera's detections into its tracker (on real inference only),
+    update stats per detection and history from track events, and publish
+    the frame with the tracks to draw on it. Returns the most persistent triggering track as a dict, or
+    None, for the failure logic.
+    """
+    thresholds = get_class_thresholds(cam_id)
+    detect_thresholds = thresholds["detect"]
+    trigger_thresholds = thresholds["trigger"]
+
+    if do_infer:
+        dets = np.asarray(dets, DETECTION_DTYPE)
+        dets = dets[(dets["class"] >= 0) & (dets["class"] < len(CLASS_NAMES))]
+        # Already filtered in post_process_yolo; re-checked for cached
+        # results decoded before a threshold change
+        dets = dets[dets["conf"] >= detect_thresholds[dets["class"]]]
+        tracks = update_tracks(cam_id, dets, trigger_thresholds)
+    else:
+        tracks = trackers[cam_id]["tracks"]
+
+    triggering = tracks["conf"] >= trigger_thresholds[tracks["class"]]
+    visible = tracks["missed"] == 0
+
+    # Stats keep counting per inference: every detection, and every
+    # detection at trigger level (once per category per tick)
+    stats_block = state["stats"].get(cam_id)
+    if do_infer and stats_block is not None and len(dets):
+        per_cat = stats_block.get("per_category", {})
+        det_triggering = dets["conf"] >= trigger_thresholds[dets["class"]]
+        stats_block["detections"] += len(dets)
+        stats_block["failures"] += int(det_triggering.sum())
+
+        for cid in np.unique(dets["class"]):
+            key = CLASS_NAMES[cid].lower()
+            if key in per_cat:
+                of_class = dets["class"] == cid
+                per_cat[key]["detections"] = per_cat[key].get("detections", 0) + int(of_class.sum())
+                if det_triggering[of_class].any():
+                    per_cat[key]["failures"] = per_cat[key].get("failures", 0) + 1
+
+    # History records track events (new track, first trigger) rather than
+    # every frame a defect stays in view
+    if do_infer and not state["action_triggered"]:
+        for i in np.flatnonzero(visible):
+            level = 2 if triggering[i] else 1
+            if level <= tracks["reported"][i]:
+                continue
+
+            key = CLASS_NAMES[tracks["class"][i]].lower()
+            tracks["reported"][i] = level
+            record_event(cam_id, key, int(tracks["conf"][i] * 100),
+                         "trigger" if level == 2 else "detect",
+                         int(tracks["id"][i]), box_fractions(tracks["box"][i], img.shape))
+
+    shown = tracks[visible]
+    state["cameras"][cam_id]["score"] = float(shown["conf"].max()) if len(shown) else 0.0
+
+    publish_view(cam_id, img, (shown, triggering[visible]) if len(shown) else None)
+
+    # Only tracks matched this tick; a missed one still holds its count
+    # but is not evidence of a failure on its own
+    candidates = np.flatnonzero(triggering & visible)
+    if not len(candidates):
+        return None
+
+    # Most persistent track first, then the most confident
+    best = candidates[np.lexsort((-tracks["conf"][candidates], -tracks["trigger_hits"][candidates]))[0]]
+    return {
+        "camera": cam_id,
+        "category": CLASS_NAMES[tracks["class"][best]].lower(),
+        "confidence": float(tracks["conf"][best]),
+        "trigger_hits": int(tracks["trigger_hits"][best]),
+        "track": int(tracks["id"][best]),
+        "box": box_fractions(tracks["box"][best], img.shape),
+    }
+
 def background_monitor():
     logging.info("Monitor thread started.")
 
     while True:
+        drain_commands()
+
         loop_start = time.perf_counter()
+        interval_s = current_interval_s()
+        waited = 0.0  # time spent blocked on I/O rather than working
         state["_infer_tick"] = state.get("_infer_tick", 0) + 1
         infer_every = max(1, int(config.get("infer_every_n_loops", 1)))
         do_infer = (state["_infer_tick"] % infer_every == 0)
-        
+
         if ENABLE_TIMING_LOGS:
             t_state = t_cameras = t_infer = t_draw = 0.0
         try:
-            if ENABLE_TIMING_LOGS:
-                t0 = time.perf_counter()
+            t0 = time.perf_counter()
 
             klip_state = get_printer_state()
 
+            waited += time.perf_counter() - t0
             if ENABLE_TIMING_LOGS:
                 t_state += time.perf_counter() - t0
 
             # ===== PRINT COMPLETION DETECTION =====
             # Check if print transitioned from "printing" to "complete" or "cancelled"
-            if (state.get("_last_print_state") == "printing" and 
+            if (state.get("_last_print_state") == "printing" and
                 klip_state in ["complete", "cancelled"]):
                 # Print just ended
                 send_print_summary()
-            
+
             # Update last print state for next iteration
             state["_last_print_state"] = klip_state
 
@@ -728,6 +2626,7 @@ def background_monitor():
             if klip_state != "printing" and not state["manual_override"]:
                 if state["monitoring_active"]:
                     logging.info("Printer not printing → Monitoring OFF")
+                    end_session()
                 state["monitoring_active"] = False
                 state["action_triggered"] = False
 
@@ -743,258 +2642,139 @@ def background_monitor():
             # Track last printer state
             state["_last_state"] = klip_state
 
-            masks_cfg = config.get("masks", {})
-            max_frame_score = 0.0
-            raw_max_score = 0.0
-            failure_cam = None
-
-            cam_limit = int(config.get("camera_count", 2))
+            # 1. COLLECT FRAMES from the capture workers (shared deadline,
+            #    so one stalled camera cannot delay the others past the tick)
+            t0 = time.perf_counter()
 
+            frames = {}
+            deadline = loop_start + interval_s
             for cam in config["cameras"]:
                 cam_id = cam["id"]
-                if cam_id >= cam_limit:
+                if cam_id not in capture_slots:
+                    continue
+
+                if not is_camera_active(cam):
                     state["cameras"][cam_id]["score"] = 0.0
                     continue
 
-                if not cam["enabled"] or not cam["url"]:
+                img, jpeg, error, fresh = take_frame(cam_id, deadline)
+                if not fresh:
+                    continue  # nothing new this tick, keep the last result
+
+                if error is not None:
                     state["cameras"][cam_id]["score"] = 0.0
+                    publish_view(cam_id, None)
                     continue
 
-                try:
-                    # 1. CAMERA READINESS CHECK
-                    if not camera_ready.get(cam_id, False):
-                        ok = wait_for_camera(cam_id, cam["url"], timeout_seconds=8)
-                        if not ok:
-                            # Camera never came ready → no error yet, but skip frame
-                            state["cameras"][cam_id]["score"] = 0.0
-                            state["cameras"][cam_id]["frame"] = None
-                            continue   # <-- only skip WHILE waiting
-                    # If ready once, NEVER skip the block again
-
-                    # 2. NORMAL FRAME FETCH
-                    sess = CAM_SESSIONS.get(cam_id, requests)
-                    
-                    if ENABLE_TIMING_LOGS:
-                        t0 = time.perf_counter()
+                frames[cam_id] = img
+                if ai_enabled and jpeg is not None:
+                    keep_recent_frame(cam_id, jpeg)
 
-                    r = sess.get(cam["url"], timeout=1.5)
+            waited += time.perf_counter() - t0
+            if ENABLE_TIMING_LOGS:
+                t_cameras += time.perf_counter() - t0
 
-                    if ENABLE_TIMING_LOGS:
-                        t_cameras += time.perf_counter() - t0
-                    
-                    if r.status_code != 200:
-                        raise ValueError(f"HTTP {r.status_code}")
-
-                    # --- APPLY MASKS AND RUN AI ---
-                    
-                    arr = np.frombuffer(r.content, np.uint8)
-                    img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-
-                    # If decoding failed, skip this frame safely
-                    if img is None:
-                        logging.warning(f"{camera_name(cam_id)} provided invalid image data.")
-                        state["cameras"][cam_id]["score"] = 0.0
-                        continue
-
-                    debug = img.copy()
-                    h, w = img.shape[:2]
-
-                    # Apply masks
-                    zones = masks_cfg.get(str(cam_id), [])
-                    # Determine overlay color from theme/config
-                    mask_bgr = get_mask_color_for_theme(config.get("ui_theme", "dark"), config.get("custom_theme", {}))
-                    for z in zones:
-                        try:
-                            zx = float(z["x"])
-                            zy = float(z["y"])
-                            zw = float(z["w"])
-                            zh = float(z["h"])
-                        except:
-                            continue
-
-                        mx = int(zx * w)
-                        my = int(zy * h)
-                        mw = int(zw * w)
-                        mh = int(zh * h)
-
-                        mx = max(0, min(mx, w - 1))
-                        my = max(0, min(my, h - 1))
-                        mw = max(1, min(mw, w - mx))
-                        mh = max(1, min(mh, h - my))
-
-                        # Black-out masked areas for AI processing
-                        cv2.rectangle(img, (mx, my), (mx+mw, my+mh), (0,0,0), -1)
-
-                    if not ai_enabled:
-                        state["cameras"][cam_id]["frame"] = debug
-                        continue
-
-                    # Run AI (skipped on some loops, reuse last result)
-                    if do_infer:
-                        if ENABLE_TIMING_LOGS:
-                            t0 = time.perf_counter()
-
-                        score, dets = run_inference(img, cam_id)
-
-                        if ENABLE_TIMING_LOGS:
-                            t_infer += time.perf_counter() - t0
+            # 2. SHARED INFERENCE STAGE + per-camera evaluation
+            failure_track = None
+            inferred_any = False
+
+            if not ai_enabled:
+                for cam_id, img in frames.items():
+                    publish_view(cam_id, img)
+                frames = {}
+
+            # Run AI (skipped on some loops and on unchanged scenes, reuse
+            # last result). Cameras that need it go through the model together.
+            results = {}
+            if do_infer and frames:
+                now = time.time()
+                thumbs = {}
+                for cam_id, img in frames.items():
+                    changed, thumbs[cam_id] = scene_changed(cam_id, img, now)
+                    if not changed:
+                        del thumbs[cam_id]
+
+                # Black-out masked areas for AI processing
+                batch = [(cam_id, apply_mask(frames[cam_id], cam_id)) for cam_id in thumbs]
+
+                t0 = time.perf_counter()
+
+                results = run_inference_batch(batch)
+
+                record_inference_time([cam_id for cam_id, _ in batch], time.perf_counter() - t0)
+                if ENABLE_TIMING_LOGS:
+                    t_infer += time.perf_counter() - t0
+
+                for cam_id, thumb in thumbs.items():
+                    mark_inferred(cam_id, thumb, now)
+
+            for cam_id, img in frames.items():
+                try:
+                    if cam_id in results:
+                        score, dets = results[cam_id]
 
                         # Cache results
                         last_inference[cam_id]["score"] = score
                         last_inference[cam_id]["dets"] = dets
+                        inferred_any = True
                     else:
                         # Reuse last inference result
                         cached = last_inference.get(cam_id, {})
-                        score = cached.get("score", 0.0)
                         dets = cached.get("dets", [])
 
-                    categories = config.get("ai_categories", {})
-
-                    # For failure logic...
-                    triggered_here = False
-                    trigger_conf_here = 0.0
-                    triggered_categories = set()
-                    triggered_instance_count = 0
-
-                    if ENABLE_TIMING_LOGS:
-                        t0_draw = time.perf_counter()
-                    
-                    history_best_conf = 0.0
-                    history_best_category = None
-                    history_is_trigger = False
-                    filtered_dets = []
-                    for d in dets:
-                        x, y, ww, hh = d["box"]
-                        conf = float(d["conf"])
-                        cid = d["class"]
-
-                        label = CLASS_NAMES[cid] if cid < len(CLASS_NAMES) else "FAIL"
-                        key = label.lower()
-
-                        cat_cfg = categories.get(key)
-                        if not cat_cfg or not cat_cfg.get("enabled", True):
-                            continue
-
-                        # Use camera-specific thresholds; fall back to deprecated global values for compatibility
-                        detect_thresh_key = f"cam{cam_id}_detect_threshold"
-                        trigger_thresh_key = f"cam{cam_id}_trigger_threshold"
-                        
-                        detect_thresh = float(cat_cfg.get(detect_thresh_key, cat_cfg.get("detect_threshold", 0.30)))
-                        trigger_thresh = float(cat_cfg.get(trigger_thresh_key, cat_cfg.get("trigger_threshold", 0.70)))
-
-                        if conf < detect_thresh:
-                            continue
-
-                        filtered_dets.append(d)
-                        
-                        if conf > history_best_conf:
-                            history_best_conf = conf
-                            history_best_category = key
-
-                        # per-category detections (only count on real inference)
-                        if do_infer:
-                            stats_block = state["stats"].get(cam_id)
-                            if stats_block is not None:
-                                per_cat = stats_block.get("per_category", {})
-                                if key in per_cat:
-                                    per_cat[key]["detections"] = per_cat[key].get("detections", 0) + 1
-
-                        if cat_cfg.get("trigger", False) and conf >= trigger_thresh:
-                            box_color = (0, 0, 255)
-                            text_color = (255, 255, 255)
-                            triggered_here = True
-                            trigger_conf_here = max(trigger_conf_here, conf)
-                            triggered_categories.add(key)
-                            triggered_instance_count += 1
-                            history_is_trigger = True
-                        else:
-                            box_color = (0, 255, 255)
-                            text_color = (0, 0, 0)
-
-                        # Draw detection
-                        cv2.rectangle(debug, (x, y), (x+ww, y+hh), box_color, 2)
-
-                        text = f"{label} {int(conf*100)}%"
-                        (tw, th), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
-                        ty = y - 5 if y > 20 else y + th + 5
-                        cv2.rectangle(debug, (x, ty-th-2), (x+tw, ty+2), box_color, -1)
-                        cv2.putText(debug, text, (x, ty),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, text_color, 1)
-                    
-                    if do_infer and history_best_category and not state["action_triggered"]:
-                        FAILURE_HISTORY.append({
-                            "time": time.strftime("%H:%M:%S"),
-                            "camera": cam_id,
-                            "category": history_best_category,
-                            "confidence": int(history_best_conf * 100),
-                            "severity": "trigger" if history_is_trigger else "detect"
-                        })
-
-                        if len(FAILURE_HISTORY) > MAX_FAILURE_HISTORY:
-                            FAILURE_HISTORY.pop(0)
-                    
                     if ENABLE_TIMING_LOGS:
-                        t_draw += time.perf_counter() - t0_draw
-                    
-                    if len(filtered_dets) > 0:
-                        if do_infer:
-                            state["stats"][cam_id]["detections"] += len(filtered_dets)
-                        cam_score = max(float(d["conf"]) for d in filtered_dets)
-                        state["cameras"][cam_id]["score"] = cam_score
-                        raw_max_score = max(raw_max_score, cam_score)
-                    else:
-                        state["cameras"][cam_id]["score"] = 0.0
-
-                    # For failure logic we track the best "triggerable" confidence
-                    if triggered_here and trigger_conf_here > max_frame_score:
-                        max_frame_score = trigger_conf_here
-                        failure_cam = cam_id
+                        t0 = time.perf_counter()
 
-                    if triggered_here and do_infer:
-                        state["stats"][cam_id]["failures"] += triggered_instance_count
+                    track = evaluate_detections(cam_id, img, dets, cam_id in results)
 
-                        # --- Per-category failure counts ---
-                        stats_block = state["stats"].get(cam_id)
-                        if stats_block is not None:
-                            per_cat = stats_block.get("per_category", {})
-                            for cat_key in triggered_categories:
-                                if cat_key in per_cat:
-                                    per_cat[cat_key]["failures"] = per_cat[cat_key].get("failures", 0) + 1
+                    if ENABLE_TIMING_LOGS:
+                        t_draw += time.perf_counter() - t0
 
-                    state["cameras"][cam_id]["frame"] = debug
+                    # For failure logic we follow the most persistent triggering track
+                    if track and (failure_track is None or
+                                  (track["trigger_hits"], track["confidence"]) >
+                                  (failure_track["trigger_hits"], failure_track["confidence"])):
+                        failure_track = track
 
                 except Exception as e:
-                    # Only log errors AFTER the camera succeeded at least once
-                    if camera_ready.get(cam_id, False):
-                        logging.error(f"{camera_name(cam_id)} error: {e}")
-
+                    logging.error(f"{camera_name(cam_id)} error: {e}")
                     state["cameras"][cam_id]["score"] = 0.0
-                    state["cameras"][cam_id]["frame"] = None
-                    continue
+                    publish_view(cam_id, None)
 
-            # Status machine
+            # 3. STATUS MACHINE (once per tick, across all cameras)
             if not ai_enabled:
                 state["status"] = "idle"
                 state["failure_count"] = 0
                 state["action_triggered"] = False
-                time.sleep(1)
+                reset_trackers()
+                scheduler["mode"] = "idle"
+                scheduler["clean_ticks"] = 0
+                scheduler["interval_s"] = base_interval_s()
+                publish_snapshot()
+                monitor_sleep(1.0)
                 continue
 
             # If failure already triggered, freeze state
             if state["action_triggered"]:
                 state["status"] = "failure_detected"
-                time.sleep(0.5)
+                publish_snapshot()
+                monitor_sleep(0.5)
                 continue
 
             state["status"] = "monitoring"
             retries = int(config["consecutive_failures"])
 
-            if do_infer and max_frame_score > 0.0:
-                if state["failure_count"] < retries:
-                    state["failure_count"] += 1
+            if inferred_any and failure_track:
+                # A track counts once per tick it was matched at trigger
+                # confidence, so one flickering detection elsewhere (or a
+                # long stay at detect level) cannot add up to a failure
+                state["failure_count"] = min(failure_track["trigger_hits"], retries)
+                failure_cam = failure_track["camera"]
+                failure_key = failure_track["category"]
+                failure_conf = failure_track["confidence"]
 
                 logging.info(
-                    f"Potential failure: {max_frame_score:.2f} "
+                    f"Potential failure: {failure_key} #{failure_track['track']} {failure_conf:.2f} "
                     f"(retry {state['failure_count']}/{retries})"
                 )
 
@@ -1002,35 +2782,40 @@ def background_monitor():
                     state["status"] = "failure_detected"
                     state["failure_cam"] = failure_cam
                     state["failure_reason"] = {
-                        "category": key,
-                        "confidence": trigger_conf_here
+                        "category": failure_key,
+                        "confidence": failure_conf,
+                        "track": failure_track["track"],
                     }
-                    
+
                     logging.info(
-                        f"[FAILURE] {key.capitalize()} @ {int(trigger_conf_here * 100)}% | Cam {failure_cam}"
+                        f"[FAILURE] {failure_key.capitalize()} @ {int(failure_conf * 100)}% | Cam {failure_cam}"
                     )
-                    
-                    FAILURE_HISTORY.append({
-                        "time": time.strftime("%H:%M:%S"),
-                        "camera": failure_cam,
-                        "category": "FULL FAILURE TRIGGERED",
-                        "confidence": int(trigger_conf_here * 100),
-                        "severity": "failure"
-                    })
-                    
+
+                    record_event(failure_cam, "FULL FAILURE TRIGGERED", int(failure_conf * 100),
+                                 "failure", failure_track["track"], failure_track["box"])
+
                     trigger_printer_action("AI detection")
 
-            elif do_infer and max_frame_score == 0.0:
-                if state["failure_count"] > 0:
-                    state["failure_count"] -= 1
+            elif inferred_any:
+                # No triggering track matched this tick; one that was only
+                # missed keeps what it has built up until it decays
+                state["failure_count"] = min(max(
+                    (int(t["tracks"]["trigger_hits"].max()) for t in trackers.values() if len(t["tracks"])),
+                    default=0), retries)
 
+            # Anything on screen (even below trigger level) keeps the rate up
+            risky = state["failure_count"] > 0 or any(
+                state["cameras"][cam_id]["score"] > 0.0 for cam_id in state["cameras"]
+            )
+            update_schedule(risky, inferred_any)
 
         except Exception as e:
             logging.error(f"Loop error: {e}")
 
-        interval_s = float(config.get("check_interval", 500)) / 1000.0
+        queue_archives()
+        publish_snapshot()
         elapsed = time.perf_counter() - loop_start
-        
+
         if ENABLE_TIMING_LOGS:
             total = elapsed
             logging.info(
@@ -1040,15 +2825,55 @@ def background_monitor():
                 f"infer={t_infer*1000:.1f}ms | "
                 f"draw={t_draw*1000:.1f}ms"
             )
-        
-        sleep_s = interval_s - elapsed
-        if sleep_s > 0:
-            time.sleep(sleep_s)
-        else:
-            time.sleep(0.001)
 
-# Start thread
-threading.Thread(target=background_monitor, daemon=True).start()
+        schedule_sleep(loop_start, max(0.0, elapsed - waited))
+
+publish_snapshot()
+
+# ================================================================
+#   BACKGROUND TASKS
+# ================================================================
+
+background_tasks = {}
+
+def supervise(name, target, *args):
+    """Run target(*args) on a daemon thread, restarting it if it ever raises or returns."""
+    def run():
+        while True:
+            try:
+                target(*args)
+                logging.warning(f"Task {name} exited, restarting")
+            except Exception as e:
+                logging.error(f"Task {name} crashed, restarting: {e}")
+            time.sleep(1.0)
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return thread
+
+def start_background_tasks():
+    """
+    Start one capture worker per camera slot, the monitor, the Moonraker
+    action lanes and the Moonraker websocket client, independently of
+    whichever web server hosts `app`. Safe to call more than once.
+    """
+    if background_tasks:
+        return
+
+    for cam_id in capture_slots:
+        background_tasks[f"capture-{cam_id}"] = supervise(f"capture-{cam_id}", capture_worker, cam_id)
+
+    background_tasks["monitor"] = supervise("monitor", background_monitor)
+    background_tasks["events"] = supervise("events", event_writer)
+    background_tasks["archives"] = supervise("archives", archive_writer)
+
+    for lane in action_queues:
+        background_tasks[f"actions-{lane}"] = supervise(f"actions-{lane}", action_worker, lane)
+
+    if websocket is not None:
+        background_tasks["moonraker"] = supervise("moonraker", moonraker_client)
+
+start_background_tasks()
 
 # ================================================================
 #   STATIC FILES
@@ -1069,69 +2894,193 @@ def serve_static(path):
 @app.route("/api/settings", methods=["GET", "POST"])
 def settings():
     if request.method == "POST":
-        incoming = request.json
-
-        # Check if masks are being cleared
-        if "masks" in incoming:
-            old_masks = config.get("masks", {})
-            new_masks = incoming["masks"]
-            
-            for cam_id in ["0", "1"]:
-                old_mask_list = old_masks.get(cam_id, [])
-                new_mask_list = new_masks.get(cam_id, [])
-                
-                # If old had masks but new is empty, masks were cleared
-                if len(old_mask_list) > 0 and len(new_mask_list) == 0:
-                    logging.info(f"Masks cleared on {camera_name(int(cam_id))}")
-
-        config.update(incoming)
-        save_config_to_file()
-        return jsonify({"status": "saved", "config": config})
+        done, saved = run_in_monitor(apply_settings, request.json)
+        if not done:
+            return jsonify({"status": "queued"}), 202
+        return jsonify({"status": "saved", "config": saved})
 
     return jsonify(config)
 
+def apply_settings(incoming):
+    """
+    Monitor-thread command: swap in a new config dict (copy-on-write, so
+    other threads always see a complete one) and persist it.
+    """
+    global config
+
+    # Check if masks are being cleared
+    if "masks" in incoming:
+        old_masks = config.get("masks", {})
+        new_masks = incoming["masks"]
+
+        for cam_id in ["0", "1"]:
+            old_mask_list = old_masks.get(cam_id, [])
+            new_mask_list = new_masks.get(cam_id, [])
+
+            # If old had masks but new is empty, masks were cleared
+            if len(old_mask_list) > 0 and len(new_mask_list) == 0:
+                logging.info(f"Masks cleared on {camera_name(int(cam_id))}")
+
+    changed = [
+        key for key in config_versions
+        if key in incoming and incoming[key] != config.get(key)
+    ]
+
+    updated = dict(config)
+    updated.update(incoming)
+    config = updated
+    for key in changed:
+        config_versions[key] += 1
+    save_config_to_file()
+    return config
+
 # ================================================================
 #   STATUS API
 # ================================================================
 
+def status_payload():
+    return snapshot["status"]
+
 @app.route("/api/status")
 def get_status():
-    max_score = max(
-        state["cameras"][0]["score"],
-        state["cameras"][1]["score"],
-    )
-    return jsonify({
-        "status": state["status"],
-        "score": max_score,
-        "failures": state["failure_count"],
-        "max_retries": config["consecutive_failures"],
-        "cam_stats": state["stats"],
-        "failure_cam": state.get("failure_cam"),
-        "failure_reason": state.get("failure_reason")
-    })
-    
+    return jsonify(status_payload())
+
 # ================================================================
 #   FAILURE HISTORY API
 # ================================================================
 
+EVENT_FILTERS = {
+    "session": ("session = ?", int),
+    "camera": ("camera = ?", int),
+    "category": ("category = ?", str),
+    "severity": ("severity = ?", str),
+    "since": ("time >= ?", float),
+    "until": ("time < ?", float),
+    "before": ("id < ?", int),
+}
+
+def event_json(row):
+    box = [row["x"], row["y"], row["w"], row["h"]]
+    return {
+        "id": row["id"],
+        "session": row["session"],
+        "ts": row["time"],
+        "time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["time"])),
+        "camera": row["camera"],
+        "category": row["category"],
+        "confidence": row["confidence"],
+        "severity": row["severity"],
+        "track": row["track"],
+        "box": box if None not in box else None,
+        "archive": row["archive"],
+    }
+
 @app.route("/api/failure_history")
 def api_failure_history():
-    return jsonify({"events": FAILURE_HISTORY})
+    """
+    Without parameters: the dashboard's recent events, oldest first.
 
+    With any of session, camera, category, severity, since/until (epoch
+    seconds) or limit (default 50, max 500): stored events, newest first.
+    Pass the reply's "next" as `before` for the following page. Events
+    reach the store within about EVENT_BATCH_S.
+    """
+    if not request.args:
+        return jsonify({"events": list(snapshot["history"])})
 
-@app.route("/api/failure_history/clear", methods=["POST"])
-def api_clear_failure_history():
+    where, params = [], []
+    for name, (clause, convert) in EVENT_FILTERS.items():
+        value = request.args.get(name)
+        if value is None:
+            continue
+        try:
+            params.append(convert(value))
+        except ValueError:
+            return jsonify({"error": f"Invalid {name}: {value}"}), 400
+        where.append(clause)
+
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 500)
+    sql = ("SELECT * FROM events" + (" WHERE " + " AND ".join(where) if where else "")
+           + " ORDER BY id DESC LIMIT ?")
+
+    try:
+        db = open_event_db()
+        try:
+            rows = db.execute(sql, (*params, limit)).fetchall()
+        finally:
+            db.close()
+    except sqlite3.Error as e:
+        return jsonify({"error": f"Event store unavailable: {e}"}), 503
+
+    return jsonify({
+        "events": [event_json(row) for row in rows],
+        "next": rows[-1]["id"] if len(rows) == limit else None,
+    })
+
+@app.route("/api/failure_history/sessions")
+def api_failure_sessions():
+    """Most recent monitoring sessions (limit, default 50) with their event counts."""
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 500)
+    try:
+        db = open_event_db()
+        try:
+            rows = db.execute(
+                "SELECT s.id, s.started, s.ended, s.source,"
+                " (SELECT COUNT(*) FROM events e WHERE e.session = s.id) AS events"
+                " FROM sessions s ORDER BY s.id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        finally:
+            db.close()
+    except sqlite3.Error as e:
+        return jsonify({"error": f"Event store unavailable: {e}"}), 503
+
+    return jsonify({"sessions": [dict(row) for row in rows], "current": snapshot["session"]})
+
+def clear_history():
+    """Clear the dashboard list; the event store keeps its record."""
     FAILURE_HISTORY.clear()
     logging.info("Failure history cleared")
-    return jsonify({"success": True})
+
+@app.route("/api/failure_history/clear", methods=["POST"])
+def api_clear_failure_history():
+    done, _ = run_in_monitor(clear_history)
+    return command_response(done)
+
+@app.route("/api/archives/<name>")
+def api_archive(name):
+    """Image URLs archived for an event's "archive": frame-NN.jpg oldest first, then annotated.jpg."""
+    path = os.path.join(ARCHIVE_DIR, name)
+    if name.startswith(".") or not os.path.isdir(path):
+        return jsonify({"error": "Archive not found (or not written yet)"}), 404
+
+    return jsonify({
+        "name": name,
+        "images": [f"/api/archives/{name}/{filename}"
+                   for filename in sorted(os.listdir(path), key=lambda f: (f == "annotated.jpg", f))],
+    })
+
+@app.route("/api/archives/<name>/<filename>")
+def api_archive_image(name, filename):
+    if name.startswith("."):
+        return jsonify({"error": "Archive not found"}), 404
+    return send_from_directory(os.path.join(ARCHIVE_DIR, name), filename, max_age=86400)
 
 # ================================================================
 #   FRAME API
 # ================================================================
 
-@app.route("/api/frame/<int:cam_id>")
-def get_frame(cam_id):
-    if cam_id not in state["cameras"] or state["cameras"][cam_id]["frame"] is None:
+# Distinguishes ETags across restarts, since frame sequence numbers reset
+BOOT_ID = f"{int(time.time()):x}"
+
+# Encoded JPEG per camera for the current frame_seq, one per overlay variant,
+# shared by every client polling the camera
+_jpeg_cache = {}
+_jpeg_locks = {0: threading.Lock(), 1: threading.Lock()}
+_no_signal_jpeg = None
+
+def no_signal_jpeg():
+    global _no_signal_jpeg
+    if _no_signal_jpeg is None:
         blank = np.zeros((360, 640, 3), np.uint8)
 
         # Center the placeholder text so it doesn't get clipped by object-fit: cover
@@ -1150,52 +3099,272 @@ def get_frame(cam_id):
 
         cv2.putText(blank, text, (x, y), font, font_scale, color, thickness, cv2.LINE_AA)
         ok, buf = cv2.imencode(".jpg", blank)
-        return Response(buf.tobytes(), mimetype="image/jpeg")
+        _no_signal_jpeg = buf.tobytes()
+    return _no_signal_jpeg
+
+def image_response(data, etag, mimetype="image/jpeg"):
+    """Image response with an ETag; a 304 when the client already has it (data is None)."""
+    resp = Response(data if data is not None else b"", status=200 if data is not None else 304,
+                    mimetype=mimetype)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+PREVIEW_FORMATS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, "image/jpeg"),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, "image/webp"),
+}
 
-    frame = state["cameras"][cam_id]["frame"].copy()
+# Requested widths snap up to one of these, so clients cannot make the
+# server keep a resized frame (and overlay mask) for every width they ask
+PREVIEW_WIDTHS = (320, 480, 640, 960, 1280, 1920)
 
-    # If client passed a mask_color, use it to render the overlay on-the-fly.
-    mask_color_hex = request.args.get("mask_color")
-    show_mask = state.get("show_mask_overlay", False)
+def preview_params(args):
+    """(max_width, quality, format) from request args, defaulting to the preview_* settings."""
+    try:
+        width = int(args.get("w", config.get("preview_max_width", 960)))
+    except (TypeError, ValueError):
+        width = 0
+    try:
+        quality = int(args.get("q", config.get("preview_quality", 80)))
+    except (TypeError, ValueError):
+        quality = 80
+
+    fmt = str(args.get("fmt", config.get("preview_format", "jpeg"))).lower()
+    if fmt not in PREVIEW_FORMATS:
+        fmt = "jpeg"
+
+    # 0 = full resolution
+    if width > 0:
+        width = next((step for step in PREVIEW_WIDTHS if step >= width), 0)
+    return width, min(max(quality, 20), 95), fmt
+
+# Mask zones at preview size for the dashboard overlay. Kept apart from
+# the monitor's _mask_cache, which HTTP threads must not touch.
+_overlay_zones = collections.OrderedDict()
+_overlay_zones_lock = threading.Lock()
+OVERLAY_ZONES_MAX = 8
+
+def overlay_zone(cam_id, h, w):
+    """Bool array of the masked pixels at h x w for the overlay, or None when unmasked."""
+    key = (cam_id, h, w, config_versions["masks"])
+    with _overlay_zones_lock:
+        if key in _overlay_zones:
+            _overlay_zones.move_to_end(key)
+            return _overlay_zones[key]
+
+    keep = compile_mask(config.get("masks", {}).get(str(cam_id), []), h, w)
+    zone = None if keep is None else keep[:, :, 0] == 0
+
+    with _overlay_zones_lock:
+        _overlay_zones[key] = zone
+        while len(_overlay_zones) > OVERLAY_ZONES_MAX:
+            _overlay_zones.popitem(last=False)
+    return zone
+
+def annotate(frame, overlay, scale=1.0):
+    """Draw published tracks (boxes, labels) onto a copy of the frame, boxes scaled by `scale`."""
+    tracks, triggering = overlay
+    frame = frame.copy()
+
+    for track, is_trigger in zip(tracks, triggering):
+        x, y, ww, hh = (int(v * scale) for v in track["box"])
+        conf = float(track["conf"])
+
+        if is_trigger:
+            box_color = (0, 0, 255)
+            text_color = (255, 255, 255)
+        else:
+            box_color = (0, 255, 255)
+            text_color = (0, 0, 0)
+
+        # Draw track
+        cv2.rectangle(frame, (x, y), (x+ww, y+hh), box_color, 2)
+
+        text = f"{CLASS_NAMES[track['class']]} #{track['id']} {int(conf*100)}%"
+        (tw, th), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+        ty = y - 5 if y > 20 else y + th + 5
+        cv2.rectangle(frame, (x, ty-th-2), (x+tw, ty+2), box_color, -1)
+        cv2.putText(frame, text, (x, ty),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, text_color, 1)
+
+    return frame
+
+def encoded_frame(cam_id, mask_color_hex=None, params=None):
+    """
+    (etag, image bytes, mimetype) for a camera's current dashboard frame
+    at preview `params` (see preview_params), encoded once per frame_seq
+    and variant and shared by all clients. The frame is resized first, so
+    annotation, mask blending and encoding all run at preview size.
+    """
+    max_width, quality, fmt = params or preview_params({})
+    ext, quality_flag, mimetype = PREVIEW_FORMATS[fmt]
+    snap = snapshot
+    seq, frame, overlay = snap["views"].get(cam_id, (0, None, None))
+
+    if frame is None:
+        return f"{BOOT_ID}-nosignal", no_signal_jpeg(), "image/jpeg"
+
+    h, w = frame.shape[:2]
+    out_w = w if not max_width or max_width >= w else max_width
+    out_h = max(1, round(h * out_w / w))
 
     # Only render visual overlays when the UI has requested mask visualization.
-    if show_mask:
+    zone = overlay_zone(cam_id, out_h, out_w) if snap["show_mask_overlay"] else None
+    if zone is not None:
         # prefer explicit client color; otherwise use theme/config mapping
         if mask_color_hex:
             mask_bgr = hex_to_bgr(mask_color_hex)
         else:
             mask_bgr = get_mask_color_for_theme(config.get("ui_theme", "dark"), config.get("custom_theme", {}))
+        variant = "mask-%02x%02x%02x-%d" % (*mask_bgr, config_versions["masks"])
+    else:
+        variant = "raw"
+
+    variant = f"{out_w}-{fmt}{quality}-{variant}"
+    etag = f"{BOOT_ID}-{cam_id}-{seq}-{variant}"
+
+    with _jpeg_locks[cam_id]:
+        entry = _jpeg_cache.get(cam_id)
+        if entry is None or entry["seq"] != seq:
+            entry = {"seq": seq, "variants": {}, "bases": {}}
+            _jpeg_cache[cam_id] = entry
+
+        data = entry["variants"].get(variant)
+        if data is None:
+            # Resized + annotated frame, shared by all variants of this width
+            base = entry["bases"].get(out_w)
+            if base is None:
+                base = frame
+                if out_w != w:
+                    base = cv2.resize(frame, (out_w, out_h), interpolation=cv2.INTER_AREA)
+                if overlay is not None:
+                    base = annotate(base, overlay, out_w / w)
+                entry["bases"][out_w] = base
+
+            if zone is not None:
+                # Blend the overlay color into the masked pixels only
+                base = base.copy()
+                base[zone] = (base[zone] * 0.80 + np.array(mask_bgr) * 0.20).astype(np.uint8)
+
+            ok, buf = cv2.imencode(ext, base, [quality_flag, quality])
+            if not ok:
+                raise ValueError(f"{fmt} encoding is not supported by this OpenCV build")
+            data = buf.tobytes()
+            entry["variants"][variant] = data
+
+    return etag, data, mimetype
 
-        zones_cfg = config.get("masks", {}).get(str(cam_id), [])
-        if zones_cfg:
-            overlay = frame.copy()
-            h, w = frame.shape[:2]
-            for z in zones_cfg:
-                try:
-                    zx = float(z.get("x", 0))
-                    zy = float(z.get("y", 0))
-                    zw = float(z.get("w", 0))
-                    zh = float(z.get("h", 0))
-                except Exception:
-                    continue
-
-                mx = int(zx * w)
-                my = int(zy * h)
-                mw = int(zw * w)
-                mh = int(zh * h)
-
-                mx = max(0, min(mx, w - 1))
-                my = max(0, min(my, h - 1))
-                mw = max(1, min(mw, w - mx))
-                mh = max(1, min(mh, h - my))
-
-                cv2.rectangle(overlay, (mx, my), (mx+mw, my+mh), mask_bgr, -1)
+@app.route("/api/frame/<int:cam_id>")
+def get_frame(cam_id):
+    # If client passed a mask_color, use it to render the overlay on-the-fly.
+    etag, data, mimetype = encoded_frame(cam_id, request.args.get("mask_color"),
+                                         preview_params(request.args))
+    if request.if_none_match.contains(etag):
+        return image_response(None, etag, mimetype)
+    return image_response(data, etag, mimetype)
 
-            # Blend overlay onto frame
-            cv2.addWeighted(overlay, 0.20, frame, 0.80, 0, frame)
+# ================================================================
+#   LIVE STREAMS (MJPEG + SSE)
+# ================================================================
 
-    ok, buf = cv2.imencode(".jpg", frame)
-    return Response(buf.tobytes(), mimetype="image/jpeg")
+# Streams re-check at least this often, so dead connections are noticed
+STREAM_KEEPALIVE_S = 2.0
+# The scheduler's rates and timings are EMAs that move every tick, so
+# they go out on their own SSE event at most this often
+SCHEDULER_EVENT_S = 5.0
+MJPEG_RESEND_S = 10.0
+
+# Each open stream holds a server worker; cap them so ordinary requests
+# always find a free one
+_stream_slots = threading.BoundedSemaphore(max(1, int(config.get("web_max_streams", 36))))
+
+def stream_response(body, mimetype, headers):
+    """Streaming response holding one stream slot until the server closes it, or a 503 if none is free."""
+    if not _stream_slots.acquire(blocking=False):
+        return Response("Too many live viewers", status=503, headers={"Retry-After": "5"})
+
+    resp = Response(body, mimetype=mimetype, headers=headers)
+    resp.call_on_close(_stream_slots.release)
+    return resp
+
+@app.route("/api/stream/<int:cam_id>")
+def stream_frames(cam_id):
+    """multipart/x-mixed-replace feed of the dashboard frame, pushed as the monitor publishes."""
+    mask_color_hex = request.args.get("mask_color")
+    params = preview_params(request.args)
+
+    def generate():
+        last_etag = None
+        last_sent = 0.0
+        seen = None
+        while True:
+            etag, data, mimetype = encoded_frame(cam_id, mask_color_hex, params)
+
+            # Unchanged frames are re-sent now and then so a closed
+            # connection is noticed and its stream slot freed
+            if etag != last_etag or time.monotonic() - last_sent >= MJPEG_RESEND_S:
+                last_etag = etag
+                last_sent = time.monotonic()
+                yield (b"--frame\r\nContent-Type: " + mimetype.encode() + b"\r\nContent-Length: "
+                       + str(len(data)).encode() + b"\r\n\r\n" + data + b"\r\n")
+
+            seen = wait_dashboard(seen, STREAM_KEEPALIVE_S)
+
+    return stream_response(generate(), "multipart/x-mixed-replace; boundary=frame",
+                           {"Cache-Control": "no-cache"})
+
+@app.route("/api/events")
+def stream_events():
+    """
+    Server-Sent Events for the dashboard: "status", "history" and "logs"
+    events, each sent only when its content changed, and "scheduler"
+    (the status' scheduler numbers) at most every SCHEDULER_EVENT_S.
+    """
+    # A reconnecting EventSource sends the id of the last logs event it
+    # saw, so it only gets the lines it missed
+    resume_seq = request.headers.get("Last-Event-ID", type=int)
+
+    def generate():
+        sent = {}
+        log_seq = resume_seq
+        last_sent = time.monotonic()
+        scheduler_sent = 0.0
+        seen = None
+        yield "retry: 2000\n\n"
+
+        while True:
+            snap = snapshot
+            status = dict(snap["status"])
+            scheduler_info = status.pop("scheduler", None)
+
+            events = [("status", status), ("history", {"events": snap["history"]})]
+            if time.monotonic() - scheduler_sent >= SCHEDULER_EVENT_S:
+                scheduler_sent = time.monotonic()
+                events.append(("scheduler", scheduler_info))
+
+            for name, payload in events:
+                text = json.dumps(payload)
+                if sent.get(name) != text:
+                    sent[name] = text
+                    last_sent = time.monotonic()
+                    yield f"event: {name}\ndata: {text}\n\n"
+
+            if log_seq != log_ring.seq:
+                log_seq, lines, reset = log_ring.since(log_seq)
+                payload = {"seq": log_seq, "reset": reset, "lines": lines}
+                last_sent = time.monotonic()
+                yield f"id: {log_seq}\nevent: logs\ndata: {json.dumps(payload)}\n\n"
+
+            # Publishes that changed nothing still count as silence
+            if time.monotonic() - last_sent >= STREAM_KEEPALIVE_S:
+                last_sent = time.monotonic()
+                yield ": keepalive\n\n"
+
+            seen = wait_dashboard(seen, STREAM_KEEPALIVE_S)
+
+    return stream_response(generate(), "text/event-stream",
+                           {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # ================================================================
 #   LOG PANEL ENDPOINT
@@ -1203,13 +3372,44 @@ def get_frame(cam_id):
 
 @app.route("/api/logs")
 def api_logs():
-    """Return the last X lines of logs to the UI."""
-    return jsonify({"logs": "\n".join(LOG_BUFFER)})
+    """
+    Log lines for the UI. With ?since=<seq> (the "seq" of the previous
+    reply) only newer lines are returned; "reset" means the reply holds
+    the whole buffer instead. Without it the reply also carries the
+    buffer as one "logs" string, as it always has.
+    """
+    since = request.args.get("since", type=int)
+    seq, lines, reset = log_ring.since(since)
+    reply = {"seq": seq, "reset": reset, "lines": lines}
+    if since is None:
+        reply["logs"] = "\n".join(lines)
+    return jsonify(reply)
 
 # ================================================================
 #   RUN SERVER
 # ================================================================
 
+try:
+    import waitress
+except ImportError:
+    waitress = None
+
+WEB_PORT = 7126
+
+def serve():
+    """Serve `app` with waitress when available (or configured), else the Flask dev server."""
+    kind = config.get("web_server", "auto")
+
+    if kind in ("auto", "waitress") and waitress is not None:
+        threads = max(1, int(config.get("web_threads", 8))) + max(1, int(config.get("web_max_streams", 36)))
+        add_log(f"Web server (waitress, {threads} workers) running at port {WEB_PORT}")
+        waitress.serve(app, host="0.0.0.0", port=WEB_PORT, threads=threads, ident=None)
+        return
+
+    if kind == "waitress":
+        logging.warning("waitress not found, using the Flask development server.")
+    add_log(f"Web server running at port {WEB_PORT}")
+    app.run(host="0.0.0.0", port=WEB_PORT, threaded=True)
+
 if __name__ == "__main__":
-    add_log("Web server running at port 7126")
-    app.run(host="0.0.0.0", port=7126, threaded=True)
+    serve()
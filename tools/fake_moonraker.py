@@ -0,0 +1,343 @@
+"""
+Minimal local stand-in for Moonraker, for developing and checking the
+plugin's printer connection without a printer.
+
+It speaks just enough of Moonraker on one port (standard library only):
+  - the JSON-RPC websocket at /websocket: printer.objects.subscribe, and
+    pushes of notify_status_update, notify_klippy_shutdown and
+    notify_klippy_ready
+  - GET /printer/objects/query (the plugin's HTTP fallback)
+  - POST /printer/print/pause|cancel and /printer/gcode/script, which are
+    logged and answered "ok"
+
+Run it and point moonraker_url at it, then type commands to drive it:
+
+    python tools/fake_moonraker.py --port 7130
+    > printing          (print_stats.state; also standby/complete/cancelled)
+    > progress 0.42
+    > shutdown | ready  (Klippy going away / coming back)
+    > drop              (close every websocket; the plugin should reconnect)
+
+Or let it drive the plugin's moonraker_client through subscribe, status
+updates, a Klippy shutdown/restart and a dropped connection:
+
+    python tools/fake_moonraker.py --check
+
+The check imports plugin.py, which starts its background threads as usual
+(and creates failure_events.db next to it), so run it on a dev checkout.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class FakeMoonraker:
+    def __init__(self, port=0, host="127.0.0.1"):
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+
+        self.status = {
+            "print_stats": {"state": "standby", "filename": "test.gcode"},
+            "virtual_sdcard": {"progress": 0.0},
+        }
+        self.klippy_ready = True
+        self.clients = []
+        self.subscribes = 0
+        self.actions = []   # (path, payload) of every POST received
+        self.lock = threading.Lock()
+
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    # ---------------- connections ----------------
+
+    def accept_loop(self):
+        while True:
+            conn, _ = self.sock.accept()
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def handle(self, conn):
+        try:
+            head = b""
+            while b"\r\n\r\n" not in head:
+                chunk = conn.recv(4096)
+                if not chunk:
+                    return
+                head += chunk
+            head, body = head.split(b"\r\n\r\n", 1)
+
+            lines = head.decode("latin-1").split("\r\n")
+            method, path, _ = lines[0].split(" ", 2)
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            if headers.get("upgrade", "").lower() == "websocket":
+                self.serve_websocket(conn, headers["sec-websocket-key"])
+                return
+
+            length = int(headers.get("content-length", 0))
+            while len(body) < length:
+                body += conn.recv(length - len(body))
+            self.serve_http(conn, method, path, body)
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def serve_http(self, conn, method, path, body):
+        if method == "GET" and path.startswith("/printer/objects/query"):
+            reply = {"result": {"eventtime": time.monotonic(), "status": self.status}}
+        elif method == "POST" and path.startswith("/printer/"):
+            payload = json.loads(body) if body else None
+            with self.lock:
+                self.actions.append((path, payload))
+            print(f"[fake moonraker] POST {path} {payload or ''}", flush=True)
+            reply = {"result": "ok"}
+        else:
+            conn.sendall(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            return
+
+        data = json.dumps(reply).encode()
+        conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                     b"Content-Length: " + str(len(data)).encode() + b"\r\nConnection: close\r\n\r\n" + data)
+
+    # ---------------- websocket ----------------
+
+    def serve_websocket(self, conn, key):
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        conn.sendall(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        with self.lock:
+            self.clients.append(conn)
+
+        try:
+            while True:
+                frame = read_frame(conn)
+                if frame is None:
+                    break
+                opcode, data = frame
+                if opcode == 0x8:      # close
+                    break
+                if opcode == 0x9:      # ping
+                    conn.sendall(encode_frame(data, 0xA))
+                    continue
+                if opcode != 0x1:
+                    continue
+
+                msg = json.loads(data)
+                if msg.get("method") == "printer.objects.subscribe":
+                    with self.lock:
+                        self.subscribes += 1
+                    if self.klippy_ready:
+                        reply = {"result": {"eventtime": time.monotonic(), "status": self.status}}
+                    else:
+                        reply = {"error": {"code": 503, "message": "Klippy Host not connected"}}
+                    send_json(conn, {"jsonrpc": "2.0", "id": msg.get("id"), **reply})
+        finally:
+            with self.lock:
+                if conn in self.clients:
+                    self.clients.remove(conn)
+
+    def broadcast(self, method, params=None):
+        msg = {"jsonrpc": "2.0", "method": method}
+        if params is not None:
+            msg["params"] = params
+        with self.lock:
+            clients = list(self.clients)
+        for conn in clients:
+            try:
+                send_json(conn, msg)
+            except OSError:
+                pass
+
+    # ---------------- scenario controls ----------------
+
+    def set_status(self, print_state=None, progress=None):
+        """Change the printer status and push the changed fields to subscribers."""
+        changed = {}
+        if print_state is not None:
+            self.status["print_stats"]["state"] = print_state
+            changed["print_stats"] = {"state": print_state}
+        if progress is not None:
+            self.status["virtual_sdcard"]["progress"] = progress
+            changed["virtual_sdcard"] = {"progress": progress}
+        self.broadcast("notify_status_update", [changed, time.monotonic()])
+
+    def klippy_shutdown(self):
+        self.klippy_ready = False
+        self.broadcast("notify_klippy_shutdown")
+
+    def klippy_restart(self):
+        self.klippy_ready = True
+        self.broadcast("notify_klippy_ready")
+
+    def drop_clients(self):
+        """Close every websocket abruptly, as a Moonraker restart would."""
+        with self.lock:
+            clients, self.clients = self.clients, []
+        for conn in clients:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def read_exact(conn, n):
+    data = b""
+    while len(data) < n:
+        chunk = conn.recv(n - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def read_frame(conn):
+    """One client frame as (opcode, unmasked payload), or None on EOF."""
+    head = read_exact(conn, 2)
+    if head is None:
+        return None
+    opcode = head[0] & 0x0F
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack(">H", read_exact(conn, 2))[0]
+    elif length == 127:
+        length = struct.unpack(">Q", read_exact(conn, 8))[0]
+
+    mask = read_exact(conn, 4) if head[1] & 0x80 else b"\0\0\0\0"
+    payload = read_exact(conn, length) if length else b""
+    if mask is None or payload is None:
+        return None
+    return opcode, bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+def encode_frame(payload, opcode=0x1):
+    """Unmasked server frame."""
+    n = len(payload)
+    if n < 126:
+        head = struct.pack(">BB", 0x80 | opcode, n)
+    elif n < 65536:
+        head = struct.pack(">BBH", 0x80 | opcode, 126, n)
+    else:
+        head = struct.pack(">BBQ", 0x80 | opcode, 127, n)
+    return head + payload
+
+
+def send_json(conn, msg):
+    conn.sendall(encode_frame(json.dumps(msg).encode()))
+
+
+# ================================================================
+#   CHECK: drive the plugin's moonraker_client against the fake
+# ================================================================
+
+def wait_until(what, predicate, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            print(f"  ok   {what}")
+            return True
+        time.sleep(0.05)
+    print(f"  FAIL {what}")
+    return False
+
+
+def run_check():
+    fake = FakeMoonraker()
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import plugin
+
+    if plugin.websocket is None:
+        print("websocket-client is not installed; the plugin only polls over HTTP.")
+        return 1
+
+    # The plugin's supervised moonraker_client follows moonraker_url changes
+    plugin.config = {**plugin.config, "moonraker_url": fake.url}
+    printer = plugin.printer
+
+    steps = [
+        ("subscribes and connects",
+         lambda: None,
+         lambda: printer["connected"] and fake.subscribes >= 1),
+        ("applies notify_status_update",
+         lambda: fake.set_status("printing", 0.25),
+         lambda: printer["state"] == "printing" and printer["progress"] == 0.25),
+        ("partial updates keep other fields",
+         lambda: fake.set_status(progress=0.5),
+         lambda: printer["state"] == "printing" and printer["progress"] == 0.5),
+        ("notify_klippy_shutdown marks it disconnected",
+         fake.klippy_shutdown,
+         lambda: not printer["connected"] and printer["state"] == "standby"),
+        # Not pushed, so only an HTTP poll can see it
+        ("polls over HTTP while disconnected",
+         lambda: fake.status["print_stats"].update(state="paused"),
+         lambda: plugin.get_printer_state() == "paused"),
+        ("re-subscribes on notify_klippy_ready",
+         lambda: (fake.status["print_stats"].update(state="printing"), fake.klippy_restart()),
+         lambda: printer["connected"] and printer["state"] == "printing" and fake.subscribes >= 2),
+        ("notices a dropped connection",
+         fake.drop_clients,
+         lambda: not printer["connected"]),
+        ("reconnects and re-subscribes",
+         lambda: None,
+         lambda: printer["connected"] and fake.subscribes >= 3),
+    ]
+
+    print(f"Fake Moonraker at {fake.url}")
+    failed = 0
+    for what, act, predicate in steps:
+        act()
+        if not wait_until(what, predicate):
+            failed += 1
+    return 1 if failed else 0
+
+
+def run_interactive(port):
+    fake = FakeMoonraker(port, host="0.0.0.0")
+    print(f"Fake Moonraker on port {fake.port}; commands: standby|printing|complete|cancelled, "
+          "progress <0-1>, shutdown, ready, drop, quit", flush=True)
+
+    for line in sys.stdin:
+        cmd, *args = line.split() or [""]
+        if cmd in ("standby", "printing", "paused", "complete", "cancelled", "error"):
+            fake.set_status(cmd)
+        elif cmd == "progress" and args:
+            fake.set_status(progress=float(args[0]))
+        elif cmd == "shutdown":
+            fake.klippy_shutdown()
+        elif cmd == "ready":
+            fake.klippy_restart()
+        elif cmd == "drop":
+            fake.drop_clients()
+        elif cmd == "quit":
+            break
+        elif cmd:
+            print(f"unknown command: {cmd}", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=7130)
+    parser.add_argument("--check", action="store_true",
+                        help="drive plugin.moonraker_client through a scripted session")
+    args = parser.parse_args()
+    sys.exit(run_check() if args.check else run_interactive(args.port))
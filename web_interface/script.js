@@ -324,21 +324,65 @@ if (cam2ClearBtn) {
 /********************************************************************
  * Image Loop
  ********************************************************************/
+// Each camera <img> holds one MJPEG stream the server pushes frames into.
+// The loop only re-points streams when the camera, overlay or tab
+// visibility changes; hidden tabs drop their streams. When the server
+// refuses a stream (viewer limit reached) the loop polls single frames
+// for a while, then tries the stream again.
+const STREAM_RETRY_MS = 10000;
+const streamRefusedUntil = { 0: 0, 1: 0 };
+
+// Same steps the server snaps ?w= to (PREVIEW_WIDTHS); 0 = full size
+const PREVIEW_WIDTHS = [320, 480, 640, 960, 1280, 1920];
+
+function streamSrc(camId, img, card, maskParam) {
+    if (card.classList.contains('disabled') || document.hidden) return "";
+
+    // Ask for a preview about as wide as the tile is drawn, in fixed
+    // steps so resizing the window does not restart the stream constantly
+    const params = [];
+    const drawnWidth = img.clientWidth * (window.devicePixelRatio || 1);
+    if (drawnWidth > 0) params.push(`w=${PREVIEW_WIDTHS.find(step => step >= drawnWidth) ?? 0}`);
+    if (maskParam) params.push(maskParam);
+
+    if (Date.now() < streamRefusedUntil[camId]) {
+        params.push(`t=${Date.now()}`);
+        return `/api/frame/${camId}?${params.join("&")}`;
+    }
+
+    return `/api/stream/${camId}${params.length ? "?" + params.join("&") : ""}`;
+}
+
+[[0, cam1Img], [1, cam2Img]].forEach(([camId, img]) => {
+    if (!img) return;
+    img.addEventListener('error', () => {
+        if ((img.getAttribute('src') || "").startsWith("/api/stream/")) {
+            streamRefusedUntil[camId] = Date.now() + STREAM_RETRY_MS;
+        }
+    });
+});
+
+function syncStreams() {
+    const maskParam = isMaskVisible ? `mask_color=${encodeURIComponent(getCssVar('--mask'))}` : '';
+
+    [[0, cam1Img, cam1Card], [1, cam2Img, cam2Card]].forEach(([camId, img, card]) => {
+        if (!img) return;
+        const src = streamSrc(camId, img, card, maskParam);
+        if ((img.getAttribute('src') || "") !== src) img.src = src;
+    });
+}
+
 function startImageLoop(rate) {
     if (imageInterval) clearInterval(imageInterval);
 
     const finalRate = (rate && rate >= 100) ? rate : 500;
 
-    imageInterval = setInterval(() => {
-        const now = Date.now();
-
-        const maskParam = isMaskVisible ? `&mask_color=${encodeURIComponent(getCssVar('--mask'))}` : '';
-        cam1Img.src = cam1Card.classList.contains('disabled') ? "" : `/api/frame/0?cache_bust=${now}${maskParam}`;
-        cam2Img.src = cam2Card.classList.contains('disabled') ? "" : `/api/frame/1?cache_bust=${now}${maskParam}`;
-
-    }, finalRate);
+    syncStreams();
+    imageInterval = setInterval(syncStreams, finalRate);
 }
 
+document.addEventListener('visibilitychange', syncStreams);
+
 /********************************************************************
  * Camera toggle
  ********************************************************************/
@@ -402,13 +446,17 @@ forceStartBtn.addEventListener('click', async () => {
 });
 
 /********************************************************************
- * Status polling
+ * Status
  ********************************************************************/
 async function updateStatus() {
     try {
         const resp = await fetch('/api/status');
-        const data = await resp.json();
-        
+        renderStatus(await resp.json());
+    } catch (err) {}
+}
+
+function renderStatus(data) {
+    try {
         // Per-camera detection & failure counters
         if (data.cam_stats) {
             document.getElementById("cam1-detect-count").innerText =
@@ -602,8 +650,6 @@ async function updateStatus() {
     } catch (err) {}
 }
 
-setInterval(updateStatus, 1200);
-
 /********************************************************************
  * Mask toggle
  ********************************************************************/
@@ -875,6 +921,8 @@ async function loadSettings() {
         // URLs
         document.getElementById('cam1_url_input').value = cam1.url || "";
         document.getElementById('cam2_url_input').value = cam2.url || "";
+        document.getElementById('cam1_capture_mode').value = cam1.mode || "snapshot";
+        document.getElementById('cam2_capture_mode').value = cam2.mode || "snapshot";
 
         // Moonraker URL
         document.getElementById('moonraker_url').value =
@@ -1834,6 +1882,12 @@ document.getElementById('save-settings-btn').addEventListener('click', async ()
     currentSettings.cameras[1].url =
         document.getElementById('cam2_url_input').value;
 
+    currentSettings.cameras[0].mode =
+        document.getElementById('cam1_capture_mode').value;
+
+    currentSettings.cameras[1].mode =
+        document.getElementById('cam2_capture_mode').value;
+
     currentSettings.moonraker_url =
         document.getElementById('moonraker_url').value;
 
@@ -2159,6 +2213,7 @@ function renderFailureHistory() {
             const divider = document.createElement("div");
             divider.className = "history-divider";
             divider.textContent = "— PRINT FAILURE TRIGGERED —";
+            if (evt.archive) divider.appendChild(archiveLink(evt.archive));
             historyBody.appendChild(divider);
             return; // IMPORTANT: do not render a normal row
         }
@@ -2166,7 +2221,7 @@ function renderFailureHistory() {
         // --- NORMAL HISTORY ROW ---
         const row = document.createElement("div");
 
-        const key = `${evt.time}-${evt.camera}-${evt.category}-${evt.confidence}`;
+        const key = `${evt.time}-${evt.camera}-${evt.category}-${evt.confidence}-${evt.track ?? ""}`;
 
         if (!renderedHistoryKeys.has(key)) {
             row.className = "history-row enter";
@@ -2180,17 +2235,30 @@ function renderFailureHistory() {
         row.innerHTML = `
             <span class="history-time">${evt.time}</span>
             <span class="history-cam">${camLabel}</span>
-            <span class="history-cat">${evt.category}</span>
+            <span class="history-cat">${evt.category}${evt.track ? ` #${evt.track}` : ""}</span>
             <span class="history-conf ${evt.severity}">
                 ${evt.confidence}%
             </span>
         `;
 
+        if (evt.archive) row.querySelector(".history-cat").appendChild(archiveLink(evt.archive));
+
         historyBody.appendChild(row);
     });
     
 }
 
+// Archived frames for an event (written a moment after it happens)
+function archiveLink(name) {
+    const link = document.createElement("a");
+    link.className = "history-archive";
+    link.href = `/api/archives/${encodeURIComponent(name)}/annotated.jpg`;
+    link.target = "_blank";
+    link.rel = "noopener";
+    link.textContent = "archive";
+    return link;
+}
+
 /********************************************************************
  * LOGS MODAL
  ********************************************************************/
@@ -2300,26 +2368,68 @@ function updateLogView(logText) {
     }
 }
 
-// Poll failure history
-setInterval(() => {
-    if (
-        historyModal &&
-        historyModal.open &&
-        (lastStatus === "monitoring" || lastStatus === "failure_detected")
-    ) {
-        fetchFailureHistory();
-    }
-}, 2000);
+/********************************************************************
+ * Live updates (Server-Sent Events)
+ ********************************************************************/
+// The server pushes status, history and new log lines only when they
+// change; EventSource reconnects by itself if the connection drops. A
+// refused connection (viewer limit reached) is not retried by the
+// browser, so fall back to polling status until a retry gets through.
+let liveLogLines = [];
+let liveLogSeq = null;
+let livePollInterval = null;
+
+// Log lines are numbered; both the event stream and /api/logs?since=
+// send only the lines after the last seq seen, or the whole buffer
+// with reset=true.
+function applyLogLines(data) {
+    liveLogSeq = data.seq;
+    liveLogLines = data.reset ? data.lines : liveLogLines.concat(data.lines);
+    if (liveLogLines.length > 300) liveLogLines = liveLogLines.slice(-300);
+    updateLogView(liveLogLines.join("\n"));
+}
 
-// Poll logs
-setInterval(async () => {
+async function pollLiveState() {
+    updateStatus();
     try {
-        const res = await fetch("/api/logs");
-        if (!res.ok) return;
+        const since = liveLogSeq === null ? "" : `?since=${liveLogSeq}`;
+        const res = await fetch(`/api/logs${since}`);
         const data = await res.json();
-        updateLogView(data.logs);
-    } catch (err) {}
-}, 1500);
+        if (data.reset || data.lines.length) applyLogLines(data);
+    } catch (err) {
+        console.error("Log fetch failed:", err);
+    }
+}
+
+function connectLiveEvents() {
+    const source = new EventSource("/api/events");
+
+    source.addEventListener("open", () => {
+        if (livePollInterval) clearInterval(livePollInterval);
+        livePollInterval = null;
+    });
+
+    source.addEventListener("error", () => {
+        if (source.readyState !== EventSource.CLOSED) return;
+        if (!livePollInterval) livePollInterval = setInterval(pollLiveState, 2000);
+        setTimeout(connectLiveEvents, STREAM_RETRY_MS);
+    });
+
+    source.addEventListener("status", (e) => {
+        renderStatus(JSON.parse(e.data));
+    });
+
+    source.addEventListener("history", (e) => {
+        failureHistory = JSON.parse(e.data).events || [];
+        if (historyModal && historyModal.open) renderFailureHistory();
+    });
+
+    source.addEventListener("logs", (e) => {
+        applyLogLines(JSON.parse(e.data));
+    });
+}
+
+connectLiveEvents();
 
 
 /********************************************************************